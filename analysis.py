@@ -0,0 +1,127 @@
+import argparse
+import gzip
+import sys
+import time
+from collections import namedtuple
+
+from chess import Chessboard
+
+# One analysed line of a FEN/EPD stream. fen is the board's own full FEN, round_trip tells whether it
+# reproduces the input fields (all six for FEN, the first four for EPD). error is set instead for bad lines.
+PositionResult = namedtuple("PositionResult", "line_number fen legal_moves status round_trip opcodes error")
+AnalysisStats = namedtuple("AnalysisStats", "positions errors mismatches elapsed")
+
+
+def open_positions(path):
+    # "-" is stdin, .gz dumps are decompressed on the fly
+    if path == '-':
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def iter_positions(lines, first_line_number=1):
+    # (line number, position fields, opcodes) for every position line; blank lines and # comments are skipped.
+    # A line is FEN if the 5th and 6th fields are the clocks, otherwise it is EPD and the rest are opcodes.
+    for line_number, line in enumerate(lines, first_line_number):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+        if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+            yield line_number, fields[:6], ' '.join(fields[6:])
+        else:
+            yield line_number, fields[:4], ' '.join(fields[4:])
+
+
+def check_legal(chessboard):
+    # Raises ValueError for a placement no game can reach: not one king each, pawns on the back ranks, or the
+    # side that is not to move in check
+    squares = chessboard.board.tolist()
+    for color, king in (('white', 6), ('black', -6)):
+        if squares.count(king) != 1:
+            raise ValueError(f"{squares.count(king)} {color} kings")
+    if any(abs(piece) == 1 for piece in squares[:8] + squares[56:]):
+        raise ValueError("pawn on the first or eighth rank")
+    if chessboard.is_king_under_attack('b' if chessboard.active_color == 'w' else 'w'):
+        raise ValueError("the side not to move is in check")
+
+
+def analyse_position(chessboard, line_number, fields, opcodes=''):
+    try:
+        chessboard.initialize_board_from_fen(' '.join(fields))
+        check_legal(chessboard)
+        moves = len(chessboard.legal_moves())
+        in_check = chessboard.is_king_under_attack(chessboard.active_color)
+    except (ValueError, KeyError, IndexError) as error:
+        return PositionResult(line_number, None, None, None, False, opcodes, str(error) or type(error).__name__)
+
+    if moves == 0:
+        status = "checkmate" if in_check else "stalemate"
+    else:
+        status = "check" if in_check else "-"
+    fen = chessboard.get_fen()
+    round_trip = fen.split()[:len(fields)] == fields
+    return PositionResult(line_number, fen, moves, status, round_trip, opcodes, None)
+
+
+def analyse_positions(lines, chessboard=None):
+    # Generator over the results of a FEN/EPD stream, reloading a single board for every position
+    chessboard = chessboard if chessboard is not None else Chessboard()
+    for line_number, fields, opcodes in iter_positions(lines):
+        yield analyse_position(chessboard, line_number, fields, opcodes)
+
+
+def format_result(result):
+    # Tab separated: line number, FEN, legal move count, status, round trip, and the EPD opcodes if any
+    if result.error is not None:
+        return f"{result.line_number}\terror\t{result.error}\n"
+    line = f"{result.line_number}\t{result.fen}\t{result.legal_moves}\t{result.status}\t" \
+           f"{'ok' if result.round_trip else 'mismatch'}"
+    return f"{line}\t{result.opcodes}\n" if result.opcodes else line + "\n"
+
+
+def run_analysis(lines, output, progress=0, log=sys.stderr):
+    # Writes one line per position to output and reports the throughput every `progress` positions
+    positions = errors = mismatches = 0
+    start = time.perf_counter()
+    for result in analyse_positions(lines):
+        output.write(format_result(result))
+        positions += 1
+        if result.error is not None:
+            errors += 1
+        elif not result.round_trip:
+            mismatches += 1
+        if progress and positions % progress == 0:
+            elapsed = time.perf_counter() - start
+            print(f"{positions} positions  {elapsed:.1f}s  {positions / elapsed:.0f} positions/s", file=log)
+    return AnalysisStats(positions, errors, mismatches, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate FEN/EPD files: FEN round trip, legal moves and status")
+    parser.add_argument("input", nargs="?", default="-", help="FEN or EPD file, one position per line (- for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="Result file (default: stdout)")
+    parser.add_argument("--progress", type=int, default=100000, metavar="N",
+                        help="Report the throughput every N positions (0 to disable)")
+    args = parser.parse_args()
+
+    lines = open_positions(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', buffering=1 << 20)
+    try:
+        stats = run_analysis(lines, output, args.progress)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        if output is not sys.stdout:
+            output.close()
+
+    rate = stats.positions / stats.elapsed if stats.elapsed else 0.0
+    print(f"{stats.positions} positions  {stats.errors} errors  {stats.mismatches} round trip mismatches  "
+          f"{stats.elapsed:.2f}s  {rate:.0f} positions/s", file=sys.stderr)
+    if stats.errors or stats.mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+import argparse
+import time
+
+from chess import BACKENDS, BISHOP_DIRECTIONS, KING_TARGETS, KNIGHT_TARGETS, PAWN_CAPTURES, PIECE_SYMBOLS, \
+    PIECE_VALUES_BY_SYMBOL, ROOK_DIRECTIONS, create_chessboard, format_fen
+
+# Bit i of every mask is the flat square index i used by Chessboard (row * 8 + col, row 0 is the 8th rank)
+FULL_MASK = (1 << 64) - 1
+PIECE_CODES = (1, 2, 3, 4, 5, 6, -1, -2, -3, -4, -5, -6)
+
+
+def _mask(squares):
+    mask = 0
+    for square in squares:
+        mask |= 1 << square
+    return mask
+
+
+def _build_ray_masks(d_row, d_col):
+    masks = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        squares = []
+        row, col = row + d_row, col + d_col
+        while 0 <= row < 8 and 0 <= col < 8:
+            squares.append(row * 8 + col)
+            row, col = row + d_row, col + d_col
+        masks.append(_mask(squares))
+    return tuple(masks)
+
+
+KNIGHT_MASKS = tuple(_mask(KNIGHT_TARGETS[square]) for square in range(64))
+KING_MASKS = tuple(_mask(KING_TARGETS[square]) for square in range(64))
+PAWN_ATTACK_MASKS = {piece: tuple(_mask(PAWN_CAPTURES[piece][square]) for square in range(64)) for piece in (1, -1)}
+
+# Directions that walk towards higher square indices find their first blocker with the lowest set bit,
+# the others with the highest set bit
+BISHOP_RAY_MASKS = tuple((_build_ray_masks(d_row, d_col), d_row * 8 + d_col > 0) for d_row, d_col in BISHOP_DIRECTIONS)
+ROOK_RAY_MASKS = tuple((_build_ray_masks(d_row, d_col), d_row * 8 + d_col > 0) for d_row, d_col in ROOK_DIRECTIONS)
+
+RANK_3 = _mask(range(40, 48))  # Squares a white pawn reaches with its first single push
+RANK_6 = _mask(range(16, 24))  # Same for black
+NOT_FILE_A = FULL_MASK ^ _mask(range(0, 64, 8))
+NOT_FILE_H = FULL_MASK ^ _mask(range(7, 64, 8))
+
+
+def _slider_attacks(ray_masks, square, occupied):
+    # Classical ray scan, used to fill the lookup tables below
+    attacks = 0
+    for masks, ascending in ray_masks:
+        ray = masks[square]
+        blockers = ray & occupied
+        if blockers:
+            if ascending:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= masks[blocker]
+        attacks |= ray
+    return attacks
+
+
+def _relevant_occupancy(ray_masks, square):
+    # The last square of each ray never changes the attack set, so it is left out of the key
+    mask = 0
+    for masks, ascending in ray_masks:
+        ray = masks[square]
+        if ray:
+            edge = (ray & -ray).bit_length() - 1 if not ascending else ray.bit_length() - 1
+            mask |= ray & ~(1 << edge)
+    return mask
+
+
+def _build_attack_tables(ray_masks):
+    # Per square, attacks for every subset of the relevant occupancy. A dict keyed by the masked
+    # occupancy plays the part of the magic multiplication used by C engines.
+    occupancy_masks, tables = [], []
+    for square in range(64):
+        mask = _relevant_occupancy(ray_masks, square)
+        table = {}
+        subset = 0
+        while True:
+            table[subset] = _slider_attacks(ray_masks, square, subset)
+            subset = (subset - mask) & mask  # Carry-Rippler walk over all subsets of the mask
+            if subset == 0:
+                break
+        occupancy_masks.append(mask)
+        tables.append(table)
+    return tuple(occupancy_masks), tuple(tables)
+
+
+BISHOP_OCCUPANCY, BISHOP_TABLES = _build_attack_tables(BISHOP_RAY_MASKS)
+ROOK_OCCUPANCY, ROOK_TABLES = _build_attack_tables(ROOK_RAY_MASKS)
+
+
+def bishop_attacks(square, occupied):
+    return BISHOP_TABLES[square][occupied & BISHOP_OCCUPANCY[square]]
+
+
+def rook_attacks(square, occupied):
+    return ROOK_TABLES[square][occupied & ROOK_OCCUPANCY[square]]
+
+
+# Set squares of every possible byte, one table per byte of the mask
+BYTE_SQUARES = tuple(tuple(tuple(offset + bit for bit in range(8) if byte >> bit & 1) for byte in range(256))
+                     for offset in range(0, 64, 8))
+
+
+def iter_squares(mask):
+    squares = []
+    for table in BYTE_SQUARES:
+        byte = mask & 255
+        if byte:
+            squares += table[byte]
+        mask >>= 8
+        if not mask:
+            break
+    return squares
+
+
+class BitboardChessboard:
+    def __init__(self):
+        self.pieces = dict.fromkeys(PIECE_CODES, 0)  # One mask per piece type and color
+        self.colors = {'w': 0, 'b': 0}
+        self.occupied = 0
+        self.active_color = None
+        self.castling_rights = None
+        self.en_passant_target = None
+        self.halfmove_clock = None
+        self.fullmove_number = None
+
+    def initialize_board_from_fen(self, fen):
+        fen_parts = fen.split()
+        self.pieces = dict.fromkeys(PIECE_CODES, 0)
+        square = 0
+        for symbol in fen_parts[0].replace('/', ''):
+            if symbol.isdigit():
+                square += int(symbol)
+            else:
+                self.pieces[PIECE_VALUES_BY_SYMBOL[symbol]] |= 1 << square
+                square += 1
+        self.colors['w'] = self.pieces[1] | self.pieces[2] | self.pieces[3] | self.pieces[4] | self.pieces[5] | \
+            self.pieces[6]
+        self.colors['b'] = self.pieces[-1] | self.pieces[-2] | self.pieces[-3] | self.pieces[-4] | \
+            self.pieces[-5] | self.pieces[-6]
+        self.occupied = self.colors['w'] | self.colors['b']
+
+        self.active_color = fen_parts[1]
+        self.castling_rights = fen_parts[2]
+        self.en_passant_target = fen_parts[3]
+        self.halfmove_clock = int(fen_parts[4]) if len(fen_parts) > 4 and fen_parts[4].isdigit() else None
+        self.fullmove_number = int(fen_parts[5]) if len(fen_parts) > 5 and fen_parts[
+            5].isdigit() else None
+
+    def piece_at(self, square):
+        bit = 1 << square
+        if not self.occupied & bit:
+            return 0
+        for piece, mask in self.pieces.items():
+            if mask & bit:
+                return piece
+        return 0
+
+    def get_board_fen(self):
+        rows = []
+        for row in range(8):
+            fen_row = []
+            empty_count = 0
+            for col in range(8):
+                piece = self.piece_at(row * 8 + col)
+                if piece == 0:
+                    empty_count += 1
+                    continue
+                if empty_count > 0:
+                    fen_row.append(str(empty_count))
+                    empty_count = 0
+                fen_row.append(PIECE_SYMBOLS[piece])
+            if empty_count > 0:
+                fen_row.append(str(empty_count))
+            rows.append(''.join(fen_row))
+        return '/'.join(rows)
+
+    def get_fen(self):
+        return format_fen(self)
+
+    def get_target_mask(self, square):
+        piece = self.piece_at(square)
+        if piece == 0:
+            return 0
+        own = self.colors['w' if piece > 0 else 'b']
+        kind = abs(piece)
+
+        if kind == 1:
+            empty = ~self.occupied & FULL_MASK
+            enemy = self.occupied ^ own
+            bit = 1 << square
+            if piece > 0:
+                single = (bit >> 8) & empty
+                pushes = single | ((single & RANK_3) >> 8) & empty
+            else:
+                single = (bit << 8) & empty
+                pushes = single | ((single & RANK_6) << 8) & empty
+            return pushes | (PAWN_ATTACK_MASKS[piece][square] & enemy)
+        if kind == 2:
+            attacks = KNIGHT_MASKS[square]
+        elif kind == 6:
+            attacks = KING_MASKS[square]
+        elif kind == 3:
+            attacks = bishop_attacks(square, self.occupied)
+        elif kind == 4:
+            attacks = rook_attacks(square, self.occupied)
+        else:
+            attacks = bishop_attacks(square, self.occupied) | rook_attacks(square, self.occupied)
+        return attacks & ~own
+
+    def get_valid_moves(self, row, col):
+        return {(target >> 3, target & 7) for target in iter_squares(self.get_target_mask(row * 8 + col))}
+
+    def move_sets(self, color):
+        # Pseudo-legal moves as masks: pawns as (start - end, targets) for all files at once,
+        # other pieces as (start, targets)
+        sign = 1 if color == 'w' else -1
+        pieces = self.pieces
+        occupied = self.occupied
+        own = self.colors[color]
+        not_own = ~own & FULL_MASK
+        enemy = occupied ^ own
+        empty = ~occupied & FULL_MASK
+
+        pawns = pieces[sign]
+        if sign > 0:
+            single = (pawns >> 8) & empty
+            pawn_sets = ((8, single), (16, ((single & RANK_3) >> 8) & empty),
+                         (9, ((pawns & NOT_FILE_A) >> 9) & enemy), (7, ((pawns & NOT_FILE_H) >> 7) & enemy))
+        else:
+            single = (pawns << 8) & empty
+            pawn_sets = ((-8, single), (-16, ((single & RANK_6) << 8) & empty),
+                         (-7, ((pawns & NOT_FILE_A) << 7) & enemy), (-9, ((pawns & NOT_FILE_H) << 9) & enemy))
+
+        piece_sets = []
+        for start in iter_squares(pieces[2 * sign]):
+            piece_sets.append((start, KNIGHT_MASKS[start] & not_own))
+        for start in iter_squares(pieces[3 * sign]):
+            piece_sets.append((start, bishop_attacks(start, occupied) & not_own))
+        for start in iter_squares(pieces[4 * sign]):
+            piece_sets.append((start, rook_attacks(start, occupied) & not_own))
+        for start in iter_squares(pieces[5 * sign]):
+            piece_sets.append((start, (bishop_attacks(start, occupied) | rook_attacks(start, occupied)) & not_own))
+        for start in iter_squares(pieces[6 * sign]):
+            piece_sets.append((start, KING_MASKS[start] & not_own))
+        return pawn_sets, piece_sets
+
+    def pseudo_legal_moves(self, color):
+        # Same (start, end) pairs as Chessboard.pseudo_legal_moves
+        pawn_sets, piece_sets = self.move_sets(color)
+        moves = []
+        for delta, targets in pawn_sets:
+            moves += [(end + delta, end) for end in iter_squares(targets)]
+        for start, targets in piece_sets:
+            moves += [(start, end) for end in iter_squares(targets)]
+        return moves
+
+    def count_moves(self, color):
+        # Counting needs no per-move objects at all, only a popcount per piece
+        sign = 1 if color == 'w' else -1
+        pieces = self.pieces
+        occupied = self.occupied
+        not_own = ~self.colors[color] & FULL_MASK
+        enemy = occupied & not_own
+        empty = ~occupied & FULL_MASK
+
+        pawns = pieces[sign]
+        if sign > 0:
+            single = (pawns >> 8) & empty
+            count = single.bit_count() + (((single & RANK_3) >> 8) & empty).bit_count() + \
+                (((pawns & NOT_FILE_A) >> 9) & enemy).bit_count() + (((pawns & NOT_FILE_H) >> 7) & enemy).bit_count()
+        else:
+            single = (pawns << 8) & empty
+            count = single.bit_count() + (((single & RANK_6) << 8) & empty).bit_count() + \
+                (((pawns & NOT_FILE_A) << 7) & enemy).bit_count() + (((pawns & NOT_FILE_H) << 9) & enemy).bit_count()
+
+        for start in iter_squares(pieces[2 * sign]):
+            count += (KNIGHT_MASKS[start] & not_own).bit_count()
+        for start in iter_squares(pieces[6 * sign]):
+            count += (KING_MASKS[start] & not_own).bit_count()
+        queens = pieces[5 * sign]
+        for start in iter_squares(pieces[3 * sign] | queens):
+            count += (BISHOP_TABLES[start][occupied & BISHOP_OCCUPANCY[start]] & not_own).bit_count()
+        for start in iter_squares(pieces[4 * sign] | queens):
+            count += (ROOK_TABLES[start][occupied & ROOK_OCCUPANCY[start]] & not_own).bit_count()
+        return count
+
+    def is_square_attacked(self, square, by_color):
+        sign = 1 if by_color == 'w' else -1
+        pieces = self.pieces
+        if PAWN_ATTACK_MASKS[-sign][square] & pieces[sign]:
+            return True
+        if KNIGHT_MASKS[square] & pieces[2 * sign]:
+            return True
+        if KING_MASKS[square] & pieces[6 * sign]:
+            return True
+        queens = pieces[5 * sign]
+        if bishop_attacks(square, self.occupied) & (pieces[3 * sign] | queens):
+            return True
+        return bool(rook_attacks(square, self.occupied) & (pieces[4 * sign] | queens))
+
+    def is_king_under_attack(self, color):
+        king = self.pieces[6 if color == 'w' else -6]
+        if not king:
+            return False  # King not found, shouldn't happen in a valid game
+        return self.is_square_attacked(king.bit_length() - 1, 'b' if color == 'w' else 'w')
+
+
+BENCHMARK_FENS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+]
+
+
+def _generate_all(chessboard):
+    return (chessboard.pseudo_legal_moves('w'), chessboard.pseudo_legal_moves('b'),
+            chessboard.is_king_under_attack('w'), chessboard.is_king_under_attack('b'))
+
+
+def _count_all(chessboard):
+    return (chessboard.count_moves('w'), chessboard.count_moves('b'),
+            chessboard.is_king_under_attack('w'), chessboard.is_king_under_attack('b'))
+
+
+def _same_results(first, second):
+    return all(sorted(a) == sorted(b) for a, b in zip(first[:2], second[:2])) and first[2:] == second[2:]
+
+
+def _time(function, boards, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for chessboard in boards:
+            function(chessboard)
+    return time.perf_counter() - start
+
+
+def compare_backends(fens, repeat):
+    # Run both backends over the same positions, check they agree and report the time each one takes
+    boards = {}
+    for backend in BACKENDS:
+        boards[backend] = []
+        for fen in fens:
+            chessboard = create_chessboard(backend)
+            chessboard.initialize_board_from_fen(fen)
+            boards[backend].append(chessboard)
+
+    for array_board, bitboard in zip(boards['array'], boards['bitboard']):
+        expected = _generate_all(array_board)
+        if not _same_results(expected, _generate_all(bitboard)) or \
+                _count_all(bitboard) != (len(expected[0]), len(expected[1])) + expected[2:]:
+            raise AssertionError(f"Backends disagree on the moves for {array_board.get_fen()}")
+
+    return {
+        'array': _time(_generate_all, boards['array'], repeat),
+        'bitboard': _time(_generate_all, boards['bitboard'], repeat),
+        'bitboard count': _time(_count_all, boards['bitboard'], repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the array and bitboard move generators")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("fens", nargs="*", default=BENCHMARK_FENS)
+    args = parser.parse_args()
+
+    timings = compare_backends(args.fens, args.repeat)
+    for name, seconds in timings.items():
+        print(f"{name:15} {seconds:.3f}s ({timings['array'] / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import random
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from analysis import iter_positions
+from chess import START_FEN, Chessboard, move_to_uci
+from pgn import iter_games, parse_san
+
+# Book file: magic, entry count, then the columns keys (uint64), moves (packed uint16) and weights (uint16),
+# sorted by key and by descending weight within a key. Opening a book only reads the 16 byte header.
+BOOK_MAGIC = b'CHESSBK1'
+BOOK_HEADER_BYTES = 16
+MAX_WEIGHT = 0xFFFF
+
+BookEntry = namedtuple("BookEntry", "move weight")
+
+# Weight of a book move by the game result from the mover's point of view
+RESULT_WEIGHTS = {'win': 2, 'draw': 1, 'loss': 0, 'unknown': 1}
+
+
+def _result_for(result, white_to_move):
+    if result == '1/2-1/2':
+        return 'draw'
+    if result in ('1-0', '0-1'):
+        return 'win' if (result == '1-0') == white_to_move else 'loss'
+    return 'unknown'
+
+
+def collect_pgn(pgn_path, max_ply, counts, log=sys.stderr):
+    # Add the moves of the first max_ply plies of every game to counts, {(key, move): weight}
+    chessboard = Chessboard()
+    with open(pgn_path, 'rb') as stream:
+        for game in iter_games(stream):
+            chessboard.initialize_board_from_fen(game.headers.get('FEN', START_FEN))
+            try:
+                for san in game.moves[:max_ply]:
+                    move = parse_san(chessboard, san)
+                    key = chessboard.zobrist_key
+                    weight = RESULT_WEIGHTS[_result_for(game.result, chessboard.active_color == 'w')]
+                    counts[key, move] = counts.get((key, move), 0) + weight
+                    chessboard.make_move(move)
+            except ValueError as error:
+                print(f"game at byte {game.offset}: {error}", file=log)
+
+
+def collect_epd(epd_path, counts, log=sys.stderr):
+    # Add the "bm" (best move) operations of an EPD file to counts
+    chessboard = Chessboard()
+    with open(epd_path, encoding='utf-8') as lines:
+        for line_number, fields, opcodes in iter_positions(lines):
+            for operation in opcodes.split(';'):
+                operands = operation.split()
+                if not operands or operands[0] != 'bm':
+                    continue
+                try:
+                    chessboard.initialize_board_from_fen(' '.join(fields))
+                    for san in operands[1:]:
+                        move = parse_san(chessboard, san)
+                        counts[chessboard.zobrist_key, move] = counts.get((chessboard.zobrist_key, move), 0) + 1
+                except ValueError as error:
+                    print(f"line {line_number}: {error}", file=log)
+
+
+def write_book(counts, book_path, min_weight=1):
+    entries = [(key, move, min(weight, MAX_WEIGHT)) for (key, move), weight in counts.items() if weight >= min_weight]
+    # Ascending key, then descending weight so the best move of a position comes first
+    entries.sort(key=lambda entry: (entry[0], -entry[2], entry[1]))
+    count = len(entries)
+    with open(book_path, 'wb') as book_file:
+        book_file.write(BOOK_MAGIC + count.to_bytes(8, 'little'))
+        if entries:
+            keys, moves, weights = zip(*entries)
+            book_file.write(np.array(keys, dtype='<u8').tobytes())
+            book_file.write(np.array(moves, dtype='<u2').tobytes())
+            book_file.write(np.array(weights, dtype='<u2').tobytes())
+    return count
+
+
+class OpeningBook:
+    def __init__(self, book_path):
+        with open(book_path, 'rb') as book_file:
+            header = book_file.read(BOOK_HEADER_BYTES)
+        if header[:8] != BOOK_MAGIC:
+            raise ValueError(f"{book_path} is not an opening book")
+        self.count = int.from_bytes(header[8:], 'little')
+        if self.count:
+            self.keys = np.memmap(book_path, '<u8', 'r', BOOK_HEADER_BYTES, (self.count,))
+            self.moves = np.memmap(book_path, '<u2', 'r', BOOK_HEADER_BYTES + self.count * 8, (self.count,))
+            self.weights = np.memmap(book_path, '<u2', 'r', BOOK_HEADER_BYTES + self.count * 10, (self.count,))
+        else:
+            self.keys, self.moves, self.weights = np.zeros(0, np.uint64), np.zeros(0, np.uint16), np.zeros(0, np.uint16)
+        self.random = random.Random()
+
+    def __len__(self):
+        return self.count
+
+    def probe(self, key):
+        # Book entries of the position, highest weight first
+        key = np.uint64(key)
+        first = int(np.searchsorted(self.keys, key, 'left'))
+        last = int(np.searchsorted(self.keys, key, 'right'))
+        return [BookEntry(move, weight) for move, weight in
+                zip(self.moves[first:last].tolist(), self.weights[first:last].tolist())]
+
+    def legal_entries(self, chessboard):
+        # Entries of the current position whose move is legal there, which also rules out key collisions
+        entries = self.probe(chessboard.zobrist_key)
+        if not entries:
+            return entries
+        legal = set(chessboard.legal_moves())
+        return [entry for entry in entries if entry.move in legal]
+
+    def choose_move(self, chessboard, best=False):
+        # A book move picked at random by weight (or the heaviest one), None when out of book
+        entries = [entry for entry in self.legal_entries(chessboard) if entry.weight > 0]
+        if not entries:
+            return None
+        if best:
+            return entries[0].move
+        return self.random.choices([entry.move for entry in entries], [entry.weight for entry in entries])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query opening books")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Build a book from PGN games and EPD positions with bm")
+    build_parser.add_argument("book")
+    build_parser.add_argument("sources", nargs="+", help=".pgn files, anything else is read as EPD")
+    build_parser.add_argument("--max-ply", type=int, default=20, help="Plies of every game that go into the book")
+    build_parser.add_argument("--min-weight", type=int, default=2, help="Drop moves with a lower total weight")
+    probe_parser = commands.add_parser("probe", help="List the book moves of a position")
+    probe_parser.add_argument("book")
+    probe_parser.add_argument("--fen", default=START_FEN)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        counts = {}
+        for source in args.sources:
+            if source.endswith('.pgn'):
+                collect_pgn(source, args.max_ply, counts)
+            else:
+                collect_epd(source, counts)
+        count = write_book(counts, args.book, args.min_weight)
+        print(f"{count} entries  {time.perf_counter() - start:.2f}s")
+        return
+
+    start = time.perf_counter()
+    book = OpeningBook(args.book)
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(args.fen)
+    entries = book.legal_entries(chessboard)
+    seconds = time.perf_counter() - start
+    total = sum(entry.weight for entry in entries) or 1
+    for entry in entries:
+        print(f"{move_to_uci(entry.move):6} {entry.weight:6}  {entry.weight / total:6.1%}")
+    print(f"{len(entries)} book moves ({len(book)} entries, opened and probed in {seconds * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,118 @@
-from copy import deepcopy
+import random
+from array import array
+from collections import namedtuple
 
-import pygame
 import numpy as np
 
-
-WIDTH, HEIGHT = 800, 1000
-SQUARE_SIZE = WIDTH // 8
-WHITE = (255, 255, 255)
-GREY = (128, 128, 128)
-BLACK = (0, 0, 0)
-RED = (255, 0, 0)
+from psqt import EG_SQUARE_TABLES, MAX_PHASE, MG_SQUARE_TABLES, PHASE_BY_CODE
+
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+BISHOP_DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+ROOK_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+def _on_board(row, col):
+    return 0 <= row < 8 and 0 <= col < 8
+
+
+def _build_leaper_table(offsets):
+    table = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        table.append(tuple((row + d_row) * 8 + col + d_col for d_row, d_col in offsets
+                           if _on_board(row + d_row, col + d_col)))
+    return tuple(table)
+
+
+def _build_ray_table(directions):
+    # For every square, one tuple of squares per direction, ordered outwards from the square
+    table = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        rays = []
+        for d_row, d_col in directions:
+            ray = []
+            new_row, new_col = row + d_row, col + d_col
+            while _on_board(new_row, new_col):
+                ray.append(new_row * 8 + new_col)
+                new_row, new_col = new_row + d_row, new_col + d_col
+            if ray:
+                rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return tuple(table)
+
+
+def _build_pawn_tables(piece):
+    step = -1 if piece > 0 else 1  # White pawns move up the board (towards row 0)
+    start_row = 6 if piece > 0 else 1
+    pushes, captures = [], []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        if not 0 <= row + step < 8:
+            pushes.append(())
+            captures.append(())
+            continue
+        push = [(row + step) * 8 + col] if row != 0 and row != 7 else []
+        if row == start_row:
+            push.append((row + 2 * step) * 8 + col)
+        pushes.append(tuple(push))
+        # Captures are also kept for the back ranks so they can be used for reverse attack lookups
+        captures.append(tuple((row + step) * 8 + col + d_col for d_col in (-1, 1) if 0 <= col + d_col < 8))
+    return tuple(pushes), tuple(captures)
+
+
+# Move tables, built once at import
+KNIGHT_TARGETS = _build_leaper_table(KNIGHT_OFFSETS)
+KING_TARGETS = _build_leaper_table(KING_OFFSETS)
+BISHOP_RAYS = _build_ray_table(BISHOP_DIRECTIONS)
+ROOK_RAYS = _build_ray_table(ROOK_DIRECTIONS)
+QUEEN_RAYS = tuple(BISHOP_RAYS[square] + ROOK_RAYS[square] for square in range(64))
+SLIDER_RAYS = {3: BISHOP_RAYS, 4: ROOK_RAYS, 5: QUEEN_RAYS}
+PAWN_PUSHES, PAWN_CAPTURES = {}, {}
+for _piece in (1, -1):
+    PAWN_PUSHES[_piece], PAWN_CAPTURES[_piece] = _build_pawn_tables(_piece)
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+PROMOTION_PIECES = (5, 4, 3, 2)
+
+# Moves are packed into 16 bits: start square in bits 0-5, end square in bits 6-11 and flags in bits 12-15.
+# Promotions have the 8 bit set and the piece in the low two bits; every capture has the 4 bit set.
+QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EN_PASSANT = 0, 1, 2, 3, 4, 5
+PROMOTION = 8
+PROMOTION_FLAGS = {2: 8, 3: 9, 4: 10, 5: 11}  # Unsigned piece code -> promotion flag
+PROMOTION_MOVE_FLAGS = tuple(PROMOTION_FLAGS[piece] for piece in PROMOTION_PIECES)  # Queen first
+PROMOTION_SYMBOLS = {5: 'q', 4: 'r', 3: 'b', 2: 'n'}
+FILES = 'abcdefgh'
+RANKS = '12345678'
+PIECE_SYMBOLS = {-4: 'r', -2: 'n', -3: 'b', -5: 'q', -6: 'k',
+                 -1: 'p', 1: 'P', 4: 'R', 2: 'N', 3: 'B', 5: 'Q', 6: 'K'}
+PIECE_VALUES_BY_SYMBOL = {symbol: piece for piece, symbol in PIECE_SYMBOLS.items()}
+
+# Castling right -> king start, king end, rook start, squares that must be empty, squares that must not be attacked
+CASTLING_MOVES = {
+    'K': (60, 62, 63, (61, 62), (60, 61, 62)),
+    'Q': (60, 58, 56, (57, 58, 59), (60, 59, 58)),
+    'k': (4, 6, 7, (5, 6), (4, 5, 6)),
+    'q': (4, 2, 0, (1, 2, 3), (4, 3, 2)),
+}
+# Castling rights that are lost when a piece moves from or to one of these squares
+CASTLING_RIGHTS_LOST = {60: 'KQ', 63: 'K', 56: 'Q', 4: 'kq', 7: 'k', 0: 'q'}
+
+GameStatus = namedtuple("GameStatus", "in_check checkmate stalemate winner")
+# What make_move pushes on the move stack: the move, the moving and captured piece, and the state it overwrites
+UndoRecord = namedtuple("UndoRecord", "move piece captured castling_rights en_passant_target halfmove_clock "
+                                      "zobrist_key mg_score eg_score phase")
+
+# Zobrist keys, fixed seed so position keys are stable between runs and processes
+_zobrist_random = random.Random(20240412)
+ZOBRIST_PIECES = {piece: [_zobrist_random.getrandbits(64) for _ in range(64)]
+                  for piece in (1, 2, 3, 4, 5, 6, -1, -2, -3, -4, -5, -6)}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = {right: _zobrist_random.getrandbits(64) for right in 'KQkq'}
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]  # One per file
+ZOBRIST_CASTLING['-'] = 0
 
 
 class Chessboard:
@@ -26,249 +129,528 @@ class Chessboard:
         self.move_made = False  # Flag to track whether a move has been made during the current turn
         self.promotion_square = None  # Track the square where promotion occurs
         self.promotion_piece = None  # Track the piece to promote to
+        self.move_stack = []  # Undo records for make_move / unmake_move
+        self.move_buffers = []  # Reusable move lists, one per recursion level of perft and search
+        self.pseudo_moves = array('H')  # Scratch list for the pseudo-legal moves that legal_moves filters
+        self.king_squares = {'w': None, 'b': None}  # Flat index of each king, kept up to date on every move
+        self.zobrist_key = 0  # Position key, updated incrementally by make_move
+        self.mg_score = 0  # Middle and end game material plus piece-square score for white, updated by make_move
+        self.eg_score = 0
+        self.phase = 0  # Game phase of the pieces on the board, see psqt.PHASE_WEIGHTS
+        self.status_cache = (None, None)  # (zobrist key, GameStatus) of the last position asked about
 
 
     def is_king_under_attack(self, color):
-        # Find the position of the king of the specified color
-        king_position = get_king_position(self, color)
+        king_square = self.king_squares[color]
 
-        if king_position is None:
+        if king_square is None:
             return False  # King not found, shouldn't happen in a valid game
 
-        # Check if any opponent's pieces can attack the king
-        opponent_color = 'b' if color == 'w' else 'w'
-        for i, piece in enumerate(self.board):
-            if (piece < 0 and opponent_color == 'b') or (piece > 0 and opponent_color == 'w'):
-                # Piece belongs to the opponent
-                valid_moves = self.get_valid_moves(i // 8, i % 8)
-                if king_position in valid_moves:
-                    return True
+        return self.is_square_attacked(king_square, 'b' if color == 'w' else 'w')
+
+    def is_square_attacked(self, square, by_color):
+        # Look outwards from the square for an attacker of each kind instead of generating the opponent's moves
+        board = self.board
+        sign = 1 if by_color == 'w' else -1
+
+        # A pawn attacks this square from where an opposing pawn on this square would capture
+        for source in PAWN_CAPTURES[-sign][square]:
+            if board[source] == sign:
+                return True
+        for source in KNIGHT_TARGETS[square]:
+            if board[source] == 2 * sign:
+                return True
+        for source in KING_TARGETS[square]:
+            if board[source] == 6 * sign:
+                return True
+
+        for rays, slider in ((BISHOP_RAYS, 3 * sign), (ROOK_RAYS, 4 * sign)):
+            for ray in rays[square]:
+                for source in ray:
+                    piece = board[source]
+                    if piece != 0:
+                        if piece == slider or piece == 5 * sign:
+                            return True
+                        break
 
         return False
+
+    def locate_kings(self):
+        self.king_squares = {'w': None, 'b': None}
+        for square in range(64):
+            if self.board[square] == 6:
+                self.king_squares['w'] = square
+            elif self.board[square] == -6:
+                self.king_squares['b'] = square
+
     def perform_castling(self, direction):
-        king_row, king_col = get_king_position(self, self.active_color)
-
-        if direction == "k":  # King side castling
-            if king_col + 2 > 7:  # Check if the king is not already at the edge of the board
-                return  # Invalid castling
-            # Check if there are no pieces between the king and the rook
-            if any(self.board[king_row * 8 + col] != 0 for col in range(king_col + 1, king_col + 3)):
-                return  # Invalid castling
-            # Check if the king passes through or finishes on a square attacked by an enemy piece
-            if self.is_king_under_attack(self.active_color) or \
-                    any(self.is_king_under_attack(self.active_color) for col in range(king_col, king_col + 3)):
-                return  # Invalid castling
-            # Move the king two squares to the right
-            self.board[king_row * 8 + king_col + 2] = self.board[king_row * 8 + king_col]
-            self.board[king_row * 8 + king_col] = 0
-            # Move the rook to the square next to the king
-            self.board[king_row * 8 + king_col + 1] = self.board[king_row * 8 + 7]
-            self.board[king_row * 8 + 7] = 0
-
-        elif direction == "q":  # Queen side castling
-            if king_col - 2 < 0:  # Check if the king is not already at the edge of the board
-                return  # Invalid castling
-            # Check if there are no pieces between the king and the rook
-            if any(self.board[king_row * 8 + col] != 0 for col in range(king_col - 2, king_col)):
-                return  # Invalid castling
-            # Check if the king passes through or finishes on a square attacked by an enemy piece
-            if self.is_king_under_attack(self.active_color) or \
-                    any(self.is_king_under_attack(self.active_color) for col in range(king_col - 2, king_col + 1)):
-                return  # Invalid castling
-            # Move the king two squares to the left
-            self.board[king_row * 8 + king_col - 2] = self.board[king_row * 8 + king_col]
-            self.board[king_row * 8 + king_col] = 0
-            # Move the rook to the square next to the king
-            self.board[king_row * 8 + king_col - 1] = self.board[king_row * 8]
-            self.board[king_row * 8] = 0
-
-        # Update any other game state variables as needed
-
-
-    def pawn_promotion(self, row, col, win):
-        self.valid_moves = {}  # Reset valid_moves dictionary
-        promotion_options = {
-            "queen": (5, -5),
-            "knight": (2, -2),
-            "bishop": (3, -3),
-            "rook": (4, -4)
-        }  # Piece name to integer mapping for both white and black
-        promotion_index = 0  # Start at the first promotion option
-
-        # Display piece options (queen, knight, bishop, rook)
-
-        run = True
-        while run:
-            pygame.display.update()
-
-            for event in pygame.event.get():
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_LEFT:
-                        promotion_index = (promotion_index - 1) % len(promotion_options)
-                    elif event.key == pygame.K_RIGHT:
-                        promotion_index = (promotion_index + 1) % len(promotion_options)
-                    elif event.key == pygame.K_RETURN:
-                        promotion_piece = list(promotion_options.values())[promotion_index][0]
-                        if self.active_color == 'b':  # If black's turn, choose the negative value for promotion
-                            promotion_piece = list(promotion_options.values())[promotion_index][1]
-                        self.board[row * 8 + col] = promotion_piece
-                        run = False
-
-            # Redraw the board after promotion
-            self.draw_board(win)
-            self.draw_pieces(win)
-
-            # Redraw the square with the appropriate background color
-            if (row + col) % 2 == 0:
-                pygame.draw.rect(win, GREY, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-            else:
-                pygame.draw.rect(win, WHITE, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-
-            # Display the selected promotion piece with the proper background color
-            selected_piece = list(promotion_options.keys())[promotion_index]
-            if self.active_color == 'b':  # If black's turn, load black piece images
-                selected_piece_img = pygame.transform.scale(
-                    pygame.image.load(f"static/black_{selected_piece}.png"),
-                    (SQUARE_SIZE, SQUARE_SIZE))
-            else:  # Otherwise, load white piece images
-                selected_piece_img = pygame.transform.scale(
-                    pygame.image.load(f"static/white_{selected_piece}.png"),
-                    (SQUARE_SIZE, SQUARE_SIZE))
-            win.blit(selected_piece_img, (col * SQUARE_SIZE, row * SQUARE_SIZE))
-
-            pygame.display.update()
+        # Castle on the given side ("k" or "q") if it is legal; like make_move this passes the turn
+        king_square = self.king_squares[self.active_color]
+        if king_square is None:
+            return
+        if direction == "k":
+            move = encode_move(king_square, king_square + 2, KING_CASTLE)
+        else:
+            move = encode_move(king_square, king_square - 2, QUEEN_CASTLE)
+        if move in self.legal_moves():
+            self.make_move(move)
 
     def initialize_board_from_fen(self, fen):
+        # Accepts full FEN as well as EPD, whose four fields may be followed by opcodes instead of the clocks.
+        # Everything is reset, so one board can be reloaded for every position of a large file.
         fen_parts = fen.split()
-        fen_board = fen_parts[0]
-        fen_board = fen_board.replace('/', '')
-        fen_board_index = 0
-        i = 0
-        while i < len(self.board) and fen_board_index < len(fen_board):
-            if fen_board[fen_board_index].isdigit():
-                i += int(fen_board[fen_board_index])
-                fen_board_index += 1
-            else:
-                self.board[i] = self.get_piece_value(fen_board[fen_board_index])
-                i += 1
-                fen_board_index += 1
+        if len(fen_parts) < 4:
+            raise ValueError(f"Incomplete FEN: {fen!r}")
+        squares = []
+        for symbol in fen_parts[0]:
+            if symbol.isdigit():
+                squares.extend([0] * int(symbol))
+            elif symbol != '/':
+                squares.append(PIECE_VALUES_BY_SYMBOL.get(symbol, 0))
+        if len(squares) != 64:
+            raise ValueError(f"FEN placement does not describe 64 squares: {fen_parts[0]!r}")
+        color, castling, en_passant = fen_parts[1:4]
+        if color not in ('w', 'b'):
+            raise ValueError(f"FEN side to move is not w or b: {color!r}")
+        if castling != '-' and (not set(castling) <= set('KQkq') or len(set(castling)) != len(castling)):
+            raise ValueError(f"FEN castling rights are not - or a subset of KQkq: {castling!r}")
+        if en_passant != '-' and not (len(en_passant) == 2 and en_passant[0] in FILES and en_passant[1] in '36'):
+            raise ValueError(f"FEN en passant square is not - or on the 3rd or 6th rank: {en_passant!r}")
+        self.board[:] = squares
+
+        self.locate_kings()
 
         self.active_color = fen_parts[1]
         self.castling_rights = fen_parts[2]
         self.en_passant_target = fen_parts[3]
-        self.halfmove_clock = int(fen_parts[4]) if fen_parts[4].isdigit() else None
+        self.halfmove_clock = int(fen_parts[4]) if len(fen_parts) > 4 and fen_parts[4].isdigit() else None
         self.fullmove_number = int(fen_parts[5]) if len(fen_parts) > 5 and fen_parts[
             5].isdigit() else None
+        self.move_stack = []
+        self.selected_piece = None
+        self.valid_moves = {}
+        self.promotion_square = None
+        self.zobrist_key = self.compute_zobrist_key()
+        self.mg_score, self.eg_score, self.phase = self.compute_scores()
+
+    def compute_zobrist_key(self):
+        key = 0
+        for square in range(64):
+            piece = self.board[square]
+            if piece != 0:
+                key ^= ZOBRIST_PIECES[piece][square]
+        if self.active_color == 'b':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        for right in self.castling_rights or '-':
+            key ^= ZOBRIST_CASTLING[right]
+        return key ^ self.en_passant_key(1 if self.active_color == 'w' else -1)
+
+    def en_passant_key(self, sign):
+        # Polyglot convention: the en passant file is only hashed when a pawn of the side to move (sign) attacks
+        # the target square, so transpositions that differ only in an unusable double push get the same key
+        square = parse_square(self.en_passant_target)
+        if square is not None:
+            for start in PAWN_CAPTURES[-sign][square]:
+                if self.board[start] == sign:
+                    return ZOBRIST_EN_PASSANT[square % 8]
+        return 0
+
+    def compute_scores(self):
+        # (middle game score, end game score, phase) summed over the board; make_move keeps them up to date
+        mg = eg = phase = 0
+        for square, piece in enumerate(self.board.tolist()):
+            if piece != 0:
+                mg += MG_SQUARE_TABLES[piece + 6][square]
+                eg += EG_SQUARE_TABLES[piece + 6][square]
+                phase += PHASE_BY_CODE[piece + 6]
+        return mg, eg, phase
+
+    def evaluate(self):
+        # Tapered material and piece-square score from the side to move's point of view, read from the
+        # incrementally updated scores instead of looking at the board
+        phase = min(self.phase, MAX_PHASE)
+        blended = self.mg_score * phase + self.eg_score * (MAX_PHASE - phase)
+        score = blended // MAX_PHASE if blended >= 0 else -(-blended // MAX_PHASE)  # Round towards zero
+        return score if self.active_color == 'w' else -score
 
     def get_piece_value(self, symbol):
-        piece_mapping = {'r': -4, 'n': -2, 'b': -3, 'q': -5, 'k': -6,
-                         'p': -1, 'R': 4, 'N': 2, 'B': 3, 'Q': 5, 'K': 6, 'P': 1}
-        return piece_mapping.get(symbol, 0)
+        return PIECE_VALUES_BY_SYMBOL.get(symbol, 0)
 
     def switch_active_color(self):
         self.active_color = 'b' if self.active_color == 'w' else 'w'
         self.piece_moved = False  # Reset piece_moved flag at the start of each turn
         self.move_made = False  # Reset move_made flag at the start of each turn
 
-    def draw_board(self, win):
-        win.fill(WHITE)
-        light_green = (144, 238, 144)
-        dark_green = (0, 128, 0)
-        for row in range(8):
-            for col in range(8):
-                if (row + col) % 2 == 0:
-                    pygame.draw.rect(win, GREY, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-                    if (row, col) in self.valid_moves:
-                        # Fill valid move squares with green-grey color
-                        pygame.draw.rect(win, dark_green,
-                                         (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-                else:
-                    pygame.draw.rect(win, WHITE, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-                    if (row, col) in self.valid_moves:
-                        # Fill valid move squares with white-green color
-                        pygame.draw.rect(win, light_green,
-                                         (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
-
-        # Draw pieces on the board
-        self.draw_pieces(win)
-
-    def draw_pieces(self, win):
-        piece_images = {
-            1: pygame.transform.scale(pygame.image.load("static/white_pawn.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            2: pygame.transform.scale(pygame.image.load("static/white_knight.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            3: pygame.transform.scale(pygame.image.load("static/white_bishop.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            4: pygame.transform.scale(pygame.image.load("static/white_rook.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            5: pygame.transform.scale(pygame.image.load("static/white_queen.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            6: pygame.transform.scale(pygame.image.load("static/white_king.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            -1: pygame.transform.scale(pygame.image.load("static/black_pawn.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            -2: pygame.transform.scale(pygame.image.load("static/black_knight.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            -3: pygame.transform.scale(pygame.image.load("static/black_bishop.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            -4: pygame.transform.scale(pygame.image.load("static/black_rook.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            -5: pygame.transform.scale(pygame.image.load("static/black_queen.png"), (SQUARE_SIZE, SQUARE_SIZE)),
-            -6: pygame.transform.scale(pygame.image.load("static/black_king.png"), (SQUARE_SIZE, SQUARE_SIZE))
-        }
-
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row * 8 + col]
-                if piece != 0:
-                    win.blit(piece_images[piece], (col * SQUARE_SIZE, row * SQUARE_SIZE))
-                if self.promotion_square:
-                    row, col = self.promotion_square
-                    pygame.draw.rect(win, RED, (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE), 3)
-
-    def get_square(self, x, y):
-        col = x // SQUARE_SIZE
-        row = y // SQUARE_SIZE
-        return row, col
-
-    def select_piece(self, row, col):
+    def select_piece(self, row, col, promotion=None):
         if not self.piece_moved and not self.move_made:  # Check if a piece can be selected and moved
             if self.selected_piece:
                 if (row, col) != self.selected_piece:  # Ensure the clicked square is different from the selected piece's square
-                    self.move_piece(row, col)
+                    self.move_piece(row, col, promotion)
             else:
                 piece = self.board[row * 8 + col]
                 if piece != 0:
                     self.selected_piece = (row, col)
-                    self.valid_moves = self.get_valid_moves(row, col)
+                    self.valid_moves = self.legal_targets(row, col)
+
+    def needs_promotion(self, row, col):
+        # Whether moving the selected piece to (row, col) is a promotion, so the caller can ask for a piece
+        if self.selected_piece is None:
+            return False
+        piece = self.board[self.selected_piece[0] * 8 + self.selected_piece[1]]
+        return abs(piece) == 1 and (row == 0 or row == 7) and (row, col) in self.valid_moves
 
-    def move_piece(self, row, col, win):
+    def move_piece(self, row, col, promotion=None):
+        # promotion is the unsigned piece code to promote to, a queen if not given
         if self.selected_piece and not self.piece_moved and not self.move_made:
-            piece = self.board[self.selected_piece[0] * 8 + self.selected_piece[1]]
+            start = self.selected_piece[0] * 8 + self.selected_piece[1]
+            piece = self.board[start]
             if (row, col) != self.selected_piece:  # Ensure the destination is different from the current location
                 if (row, col) in self.valid_moves and \
                         (piece > 0 and self.active_color == 'w' or piece < 0 and self.active_color == 'b'):
                     # Move the piece only if it's the correct player's turn
-                    #start_square = chr(self.selected_piece[1] + 97) + str(8 - self.selected_piece[0])
-                    #end_square = chr(col + 97) + str(8 - row)
-                    #print(f"{start_square} -> {end_square}")  # Print move in chess notation
-                    self.board[row * 8 + col] = piece
-                    self.board[self.selected_piece[0] * 8 + self.selected_piece[1]] = 0
-
-                    # Check for pawn promotion
-                    if piece == 1 and row == 0:  # White pawn reached the top row
-                        self.pawn_promotion(row, col, win)  # Pass the 'win' argument here
-                    elif piece == -1 and row == 7:  # Black pawn reached the bottom row
-                        self.pawn_promotion(row, col, win)  # Pass the 'win' argument here
+                    # make_move also handles castling, en passant and promotion, and passes the turn
+                    self.make_move(self.find_move(start, row * 8 + col, promotion))
 
                     self.selected_piece = None
                     self.valid_moves = {}
                     self.piece_moved = True
                     self.move_made = True  # Set move_made to True after a move
 
-                    # Check for castling
-                    if abs(piece) == 6 and self.selected_piece is not None and abs(self.selected_piece[1] - col) == 2:
-                        # Castling move, move the rook
-                        if col == 6:  # King side castling
-                            self.board[row * 8 + 5] = self.board[row * 8 + 7]
-                            self.board[row * 8 + 7] = 0
-                        elif col == 2:  # Queen side castling
-                            self.board[row * 8 + 3] = self.board[row * 8]
-                            self.board[row * 8] = 0
+    def find_move(self, start, end, promotion=None):
+        # The packed legal move from start to end, promoting to a queen unless another piece is given
+        promotion = promotion or 5
+        for move in self.legal_moves():
+            if move & 0xFFF == start | end << 6 and (not move >> 12 & PROMOTION or move_promotion(move) == promotion):
+                return move
+        return None
+
+    def make_move(self, move):
+        # move is a packed move from legal_moves, its flags say how to play castling, en passant and promotion
+        start = move & 63
+        end = move >> 6 & 63
+        flags = move >> 12
+        board = self.board
+        piece = board[start]
+        captured = board[end]
+        captured_square = end
+        sign = 1 if piece > 0 else -1
+        en_passant_key = self.en_passant_key(sign)  # Before the capturing pawns can move away
+
+        if flags == EN_PASSANT:
+            captured_square = end + 8 if piece > 0 else end - 8
+            captured = board[captured_square]
+            board[captured_square] = 0
+
+        self.move_stack.append(UndoRecord(move, piece, captured, self.castling_rights, self.en_passant_target,
+                                          self.halfmove_clock, self.zobrist_key, self.mg_score, self.eg_score,
+                                          self.phase))
+
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_PIECES[piece][start] ^ en_passant_key
+        mg = self.mg_score - MG_SQUARE_TABLES[piece + 6][start]
+        eg = self.eg_score - EG_SQUARE_TABLES[piece + 6][start]
+        if captured != 0:
+            key ^= ZOBRIST_PIECES[captured][captured_square]
+            mg -= MG_SQUARE_TABLES[captured + 6][captured_square]
+            eg -= EG_SQUARE_TABLES[captured + 6][captured_square]
+            self.phase -= PHASE_BY_CODE[captured + 6]
+
+        board[start] = 0
+        if flags & PROMOTION:
+            moved = ((flags & 3) + 2) * (1 if piece > 0 else -1)
+            self.phase += PHASE_BY_CODE[moved + 6]
+        else:
+            moved = piece
+        board[end] = moved
+        key ^= ZOBRIST_PIECES[moved][end]
+        mg += MG_SQUARE_TABLES[moved + 6][end]
+        eg += EG_SQUARE_TABLES[moved + 6][end]
+
+        if abs(piece) == 6:
+            self.king_squares['w' if piece > 0 else 'b'] = end
+            if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+                # Castling, move the rook as well
+                rook_start, rook_end = (start + 3, start + 1) if flags == KING_CASTLE else (start - 4, start - 1)
+                rook = board[rook_start]
+                board[rook_end] = rook
+                board[rook_start] = 0
+                key ^= ZOBRIST_PIECES[rook][rook_start] ^ ZOBRIST_PIECES[rook][rook_end]
+                mg += MG_SQUARE_TABLES[rook + 6][rook_end] - MG_SQUARE_TABLES[rook + 6][rook_start]
+                eg += EG_SQUARE_TABLES[rook + 6][rook_end] - EG_SQUARE_TABLES[rook + 6][rook_start]
+        self.mg_score = mg
+        self.eg_score = eg
+
+        if self.castling_rights and self.castling_rights != '-':
+            rights = self.castling_rights
+            for square in (start, end):
+                for right in CASTLING_RIGHTS_LOST.get(square, ''):
+                    if right in rights:
+                        rights = rights.replace(right, '')
+                        key ^= ZOBRIST_CASTLING[right]
+            self.castling_rights = rights or '-'
+
+        if flags == DOUBLE_PUSH:
+            self.en_passant_target = square_name((start + end) // 2)
+            key ^= self.en_passant_key(-sign)
+        else:
+            self.en_passant_target = '-'
+        self.zobrist_key = key
+
+        if self.halfmove_clock is not None:
+            self.halfmove_clock = 0 if abs(piece) == 1 or captured != 0 else self.halfmove_clock + 1
+        if self.fullmove_number is not None and piece < 0:
+            self.fullmove_number += 1
+        self.active_color = 'b' if self.active_color == 'w' else 'w'
 
-                    # Update en passant target square after move
-                    self.en_passant_target = None
+    def unmake_move(self):
+        (move, piece, captured, castling_rights, en_passant_target, halfmove_clock, zobrist_key,
+         self.mg_score, self.eg_score, self.phase) = self.move_stack.pop()
+        start = move & 63
+        end = move >> 6 & 63
+        flags = move >> 12
+        board = self.board
+
+        board[start] = piece
+        board[end] = 0
+        if flags == EN_PASSANT:
+            board[end + 8 if piece > 0 else end - 8] = captured
+        elif captured != 0:
+            board[end] = captured
+
+        if abs(piece) == 6:
+            self.king_squares['w' if piece > 0 else 'b'] = start
+            if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+                rook_start, rook_end = (start + 3, start + 1) if flags == KING_CASTLE else (start - 4, start - 1)
+                board[rook_start] = board[rook_end]
+                board[rook_end] = 0
+
+        self.castling_rights = castling_rights
+        self.en_passant_target = en_passant_target
+        self.halfmove_clock = halfmove_clock
+        self.zobrist_key = zobrist_key
+        if self.fullmove_number is not None and piece < 0:
+            self.fullmove_number -= 1
+        self.active_color = 'b' if self.active_color == 'w' else 'w'
+
+    def leaves_king_safe(self, move):
+        # Try the move and check whether the mover's king is attacked afterwards
+        color = self.active_color
+        self.make_move(move)
+        safe = not self.is_king_under_attack(color)
+        self.unmake_move()
+        return safe
+
+    def move_buffer(self, ply):
+        # Move list owned by one recursion level, so generating moves there allocates nothing
+        while len(self.move_buffers) <= ply:
+            self.move_buffers.append(array('H'))
+        return self.move_buffers[ply]
+
+    def generate_pseudo_legal_moves(self, moves, captures_only=False):
+        # Append the packed moves of the side to move to moves, without checking whether the king is left
+        # in check. captures_only keeps captures and promotions.
+        squares = self.board.tolist()
+        sign = 1 if self.active_color == 'w' else -1
+        for start, piece in enumerate(squares):
+            if piece * sign <= 0:
+                continue
+            kind = piece * sign
+
+            if kind == 1:  # Pawn
+                # Forward pushes stop at the first occupied square
+                for end in PAWN_PUSHES[piece][start]:
+                    if squares[end] != 0:
+                        break
+                    if end < 8 or end >= 56:
+                        moves.extend(start | end << 6 | flags << 12 for flags in PROMOTION_MOVE_FLAGS)
+                    elif not captures_only:
+                        moves.append(start | end << 6 | (DOUBLE_PUSH << 12 if abs(end - start) == 16 else 0))
+                for end in PAWN_CAPTURES[piece][start]:
+                    if squares[end] * sign < 0:
+                        if end < 8 or end >= 56:
+                            moves.extend(start | end << 6 | (flags | CAPTURE) << 12 for flags in PROMOTION_MOVE_FLAGS)
+                        else:
+                            moves.append(start | end << 6 | CAPTURE << 12)
+
+            elif kind == 2 or kind == 6:  # Knight and king
+                for end in (KNIGHT_TARGETS if kind == 2 else KING_TARGETS)[start]:
+                    target = squares[end] * sign
+                    if target < 0:
+                        moves.append(start | end << 6 | CAPTURE << 12)
+                    elif target == 0 and not captures_only:
+                        moves.append(start | end << 6)
+
+            else:  # Bishop, rook and queen
+                for ray in SLIDER_RAYS[kind][start]:
+                    for end in ray:
+                        target = squares[end] * sign
+                        if target == 0:
+                            if not captures_only:
+                                moves.append(start | end << 6)
+                        else:
+                            if target < 0:
+                                moves.append(start | end << 6 | CAPTURE << 12)
+                            break
+
+        en_passant_square = parse_square(self.en_passant_target)
+        if en_passant_square is not None and squares[en_passant_square] == 0:
+            # Our pawns that could capture onto the target square stand where an enemy pawn there would capture
+            for start in PAWN_CAPTURES[-sign][en_passant_square]:
+                if squares[start] == sign:
+                    moves.append(start | en_passant_square << 6 | EN_PASSANT << 12)
+
+        if self.castling_rights and self.castling_rights != '-' and not captures_only:
+            color = self.active_color
+            opponent_color = 'b' if color == 'w' else 'w'
+            for right in self.castling_rights:
+                king_square, end, rook_square, empty_squares, safe_squares = CASTLING_MOVES[right]
+                if (right.isupper() == (color == 'w') and squares[king_square] == 6 * sign
+                        and squares[rook_square] == 4 * sign
+                        and all(squares[square] == 0 for square in empty_squares)
+                        and not any(self.is_square_attacked(square, opponent_color) for square in safe_squares)):
+                    moves.append(king_square | end << 6 | (KING_CASTLE if end > king_square else QUEEN_CASTLE) << 12)
+        return moves
+
+    def checks_and_pins(self, squares=None):
+        # Look outwards from the king of the side to move once instead of trying every move. Returns
+        # (checkers, evasions, pins): the squares of the checking pieces, the squares a move other than a king
+        # move must land on to end a single check (capture the checker or block its ray), and for every pinned
+        # piece the squares it can move to without leaving the line between the king and the pinner.
+        if squares is None:
+            squares = self.board.tolist()
+        king = self.king_squares[self.active_color]
+        checkers, evasions, pins = [], set(), {}
+        if king is None:
+            return checkers, evasions, pins
+        sign = 1 if self.active_color == 'w' else -1
+        for source in PAWN_CAPTURES[sign][king]:
+            if squares[source] == -sign:
+                checkers.append(source)
+                evasions.add(source)
+        for source in KNIGHT_TARGETS[king]:
+            if squares[source] == -2 * sign:
+                checkers.append(source)
+                evasions.add(source)
+        for rays, slider in ((BISHOP_RAYS, -3 * sign), (ROOK_RAYS, -4 * sign)):
+            for ray in rays[king]:
+                pinned = None
+                for index, square in enumerate(ray):
+                    piece = squares[square]
+                    if piece == 0:
+                        continue
+                    if piece * sign > 0:
+                        if pinned is not None:
+                            break  # Two of our pieces on the ray, neither is pinned
+                        pinned = square
+                    elif piece == slider or piece == -5 * sign:
+                        line = ray[:index + 1]
+                        if pinned is None:
+                            checkers.append(square)
+                            evasions.update(line)
+                        else:
+                            pins[pinned] = line
+                        break
+                    else:
+                        break  # An enemy piece that does not attack along this ray shields the king
+        return checkers, evasions, pins
+
+    def legal_moves(self, captures_only=False, moves=None):
+        # Every legal packed move for the side to move, including castling, en passant and one move per
+        # promotion piece. The moves are written to the given array('H') (emptied first) or a new one.
+        # Checks and pins are found once from the king, so only king moves and en passant are tested
+        # against the board after generation.
+        if moves is None:
+            moves = array('H')
+        else:
+            del moves[:]
+        pseudo_moves = self.pseudo_moves
+        del pseudo_moves[:]
+        self.generate_pseudo_legal_moves(pseudo_moves, captures_only)
+        if not pseudo_moves:
+            return moves
+        checkers, evasions, pins = self.checks_and_pins()
+        king = self.king_squares[self.active_color]
+        double_check = len(checkers) > 1
+        safe_targets = {}  # King destination -> not attacked once the king has left its square
+        for move in pseudo_moves:
+            start = move & 63
+            if start == king:
+                flags = move >> 12
+                if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+                    moves.append(move)  # Generation already checked the squares the king passes
+                    continue
+                end = move >> 6 & 63
+                safe = safe_targets.get(end)
+                if safe is None:
+                    safe = safe_targets[end] = self.king_target_safe(king, end)
+                if safe:
+                    moves.append(move)
+            elif double_check:
+                continue
+            elif move >> 12 == EN_PASSANT:
+                # Removes two pawns from a rank at once, which can expose the king sideways; just try it
+                if self.leaves_king_safe(move):
+                    moves.append(move)
+            else:
+                end = move >> 6 & 63
+                if checkers and end not in evasions:
+                    continue
+                line = pins.get(start)
+                if line is None or end in line:
+                    moves.append(move)
+        return moves
+
+    def king_target_safe(self, king, end):
+        # Whether the king can step to end, with its own square emptied so sliders see through it
+        board = self.board
+        piece = board[king]
+        board[king] = 0
+        safe = not self.is_square_attacked(end, 'b' if piece > 0 else 'w')
+        board[king] = piece
+        return safe
+
+    def has_legal_move(self):
+        return len(self.legal_moves()) > 0
+
+    def game_status(self):
+        # Check, mate and stalemate for the side to move, computed once per position
+        key, status = self.status_cache
+        if key == self.zobrist_key and status is not None:
+            return status
+        in_check = self.is_king_under_attack(self.active_color)
+        has_move = self.has_legal_move()
+        status = GameStatus(in_check=in_check,
+                            checkmate=in_check and not has_move,
+                            stalemate=not in_check and not has_move,
+                            winner=('b' if self.active_color == 'w' else 'w') if in_check and not has_move else None)
+        self.status_cache = (self.zobrist_key, status)
+        return status
+
+    def legal_targets(self, row, col):
+        start = row * 8 + col
+        return {divmod(move >> 6 & 63, 8) for move in self.legal_moves() if move & 63 == start}
+
+    def perft(self, depth):
+        # Number of leaf positions reachable in exactly depth plies
+        if depth == 0:
+            return 1
+        moves = self.legal_moves(moves=self.move_buffer(depth))
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move()
+        return nodes
+
+    def divide(self, depth):
+        # perft split by root move, keyed by the move in UCI notation
+        results = {}
+        for move in self.legal_moves():
+            self.make_move(move)
+            results[move_to_uci(move)] = self.perft(depth - 1)
+            self.unmake_move()
+        return results
 
     def squares_between_empty(self, start_row, start_col, end_col):
         # Check if the squares between start_col and end_col are empty
@@ -279,298 +661,160 @@ class Chessboard:
         return True
 
     def get_valid_moves(self, row, col):
-        piece = self.board[row * 8 + col]
-        valid_moves = set()
-
-
-        if piece == 1:  # White Pawn
-            # Move one square forward
-            if row > 0 and self.board[(row - 1) * 8 + col] == 0:
-                valid_moves.add((row - 1, col))
-                # Move two squares forward from starting position
-                if row == 6 and self.board[(row - 2) * 8 + col] == 0:
-                    valid_moves.add((row - 2, col))
-            # Capture diagonally
-            if row > 0 and col > 0 and self.board[(row - 1) * 8 + col - 1] < 0:
-                valid_moves.add((row - 1, col - 1))
-            if row > 0 and col < 7 and self.board[(row - 1) * 8 + col + 1] < 0:
-                valid_moves.add((row - 1, col + 1))
-
-
-
-        elif piece == -1:  # Black Pawn
-            # Move one square forward
-            if row < 7 and self.board[(row + 1) * 8 + col] == 0:
-                valid_moves.add((row + 1, col))
-                # Move two squares forward from starting position
-                if row == 1 and self.board[(row + 2) * 8 + col] == 0:
-                    valid_moves.add((row + 2, col))
-            # Capture diagonally
-            if row < 7 and col > 0 and self.board[(row + 1) * 8 + col - 1] > 0:
-                valid_moves.add((row + 1, col - 1))
-            if row < 7 and col < 7 and self.board[(row + 1) * 8 + col + 1] > 0:
-                valid_moves.add((row + 1, col + 1))
-
-        elif piece == 2 or piece == -2:  # Knight
-            knight_moves = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
-            for move in knight_moves:
-                new_row, new_col = row + move[0], col + move[1]
-                if 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target_piece = self.board[new_row * 8 + new_col]
-                    if target_piece == 0 or (piece < 0) != (target_piece < 0):
-                        valid_moves.add((new_row, new_col))
-
-        elif abs(piece) == 3:  # Bishop
-            directions = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-            for direction in directions:
-                for i in range(1, 8):
-                    new_row, new_col = row + direction[0] * i, col + direction[1] * i
-                    if 0 <= new_row < 8 and 0 <= new_col < 8:
-                        target_piece = self.board[new_row * 8 + new_col]
-                        if target_piece == 0:
-                            valid_moves.add((new_row, new_col))
-                        elif (piece < 0) != (target_piece < 0):
-                            valid_moves.add((new_row, new_col))
-                            break
-                        else:
-                            break
+        return {(target // 8, target % 8) for target in self.get_target_squares(row * 8 + col)}
+
+    def pseudo_legal_moves(self, color):
+        # (start, end) pairs for every piece of the color, without checking whether the king is left in check
+        sign = 1 if color == 'w' else -1
+        moves = []
+        for start, piece in enumerate(self.board):
+            if piece * sign > 0:
+                moves.extend((start, end) for end in self.get_target_squares(start))
+        return moves
+
+    def get_target_squares(self, square):
+        board = self.board
+        piece = board[square]
+        targets = []
+        if piece == 0:
+            return targets
+        kind = abs(piece)
+
+        if kind == 1:  # Pawn
+            # Forward pushes stop at the first occupied square
+            for target in PAWN_PUSHES[piece][square]:
+                if board[target] != 0:
+                    break
+                targets.append(target)
+            for target in PAWN_CAPTURES[piece][square]:
+                if board[target] * piece < 0:
+                    targets.append(target)
+
+        elif kind == 2 or kind == 6:  # Knight and king
+            for target in (KNIGHT_TARGETS if kind == 2 else KING_TARGETS)[square]:
+                if board[target] * piece <= 0:
+                    targets.append(target)
+
+        else:  # Bishop, rook and queen
+            for ray in SLIDER_RAYS[kind][square]:
+                for target in ray:
+                    target_piece = board[target]
+                    if target_piece == 0:
+                        targets.append(target)
                     else:
+                        if target_piece * piece < 0:
+                            targets.append(target)
                         break
 
-        elif abs(piece) == 4:  # Rook
-            directions = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-            for direction in directions:
-                for i in range(1, 8):
-                    new_row, new_col = row + direction[0] * i, col + direction[1] * i
-                    if 0 <= new_row < 8 and 0 <= new_col < 8:
-                        target_piece = self.board[new_row * 8 + new_col]
-                        if target_piece == 0:
-                            valid_moves.add((new_row, new_col))
-                        elif (piece < 0) != (target_piece < 0):
-                            valid_moves.add((new_row, new_col))
-                            break
-                        else:
-                            break
-                    else:
-                        break
+        return targets
 
-        elif abs(piece) == 5:  # Queen
-            directions = [(-1, -1), (-1, 1), (1, -1), (1, 1), (-1, 0), (1, 0), (0, -1), (0, 1)]
-            for direction in directions:
-                for i in range(1, 8):
-                    new_row, new_col = row + direction[0] * i, col + direction[1] * i
-                    if 0 <= new_row < 8 and 0 <= new_col < 8:
-                        target_piece = self.board[new_row * 8 + new_col]
-                        if target_piece == 0:
-                            valid_moves.add((new_row, new_col))
-                        elif (piece < 0) != (target_piece < 0):
-                            valid_moves.add((new_row, new_col))
-                            break
-                        else:
-                            break
-                    else:
-                        break
+    def get_board_fen(self):
+        # Piece placement field only
+        rows = []
+        board = self.board.tolist()
+        for row in range(8):
+            fen_row = []
+            empty_count = 0
+            for piece in board[row * 8:row * 8 + 8]:
+                if piece == 0:
+                    empty_count += 1
+                    continue
+                if empty_count > 0:
+                    fen_row.append(str(empty_count))
+                    empty_count = 0
+                fen_row.append(PIECE_SYMBOLS[piece])
+            if empty_count > 0:
+                fen_row.append(str(empty_count))
+            rows.append(''.join(fen_row))
+        return '/'.join(rows)
 
+    def get_fen(self):
+        return format_fen(self)
 
+    def get_piece_symbol(self, value):
+        return PIECE_SYMBOLS.get(value, ' ')
 
-        elif abs(piece) == 6:  # King
-            # King moves
-            king_moves = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
-            for move in king_moves:
-                new_row, new_col = row + move[0], col + move[1]
-                if 0 <= new_row < 8 and 0 <= new_col < 8:
-                    target_piece = self.board[new_row * 8 + new_col]
-                    if target_piece == 0 or (piece < 0) != (target_piece < 0):
-                        if True and True:
-                            valid_moves.add((new_row, new_col))
 
-        return valid_moves
+BACKENDS = ('array', 'bitboard')
 
-    def get_fen(self):
-        fen_board = ""
-        empty_count = 0
 
-        for i in range(64):
-            if self.board[i] == 0:
-                empty_count += 1
-            else:
-                if empty_count > 0:
-                    fen_board += str(empty_count)
-                    empty_count = 0
-                fen_board += self.get_piece_symbol(self.board[i])
+def create_chessboard(backend='array'):
+    if backend == 'array':
+        return Chessboard()
+    if backend == 'bitboard':
+        from bitboard import BitboardChessboard  # Imported here, bitboard builds on the tables in this module
+        return BitboardChessboard()
+    raise ValueError(f"Unknown board backend: {backend}")
 
-            if (i + 1) % 8 == 0:
-                if empty_count > 0:
-                    fen_board += str(empty_count)
-                    empty_count = 0  # Reset empty count after each row
-                if i != 63:
-                    fen_board += "/"
 
-        return fen_board
+def format_fen(chessboard):
+    # Full six-field FEN of either board backend; missing clocks (EPD input) are written as 0 and 1
+    return ' '.join((chessboard.get_board_fen(), chessboard.active_color or 'w', chessboard.castling_rights or '-',
+                     chessboard.en_passant_target or '-', str(chessboard.halfmove_clock or 0),
+                     str(chessboard.fullmove_number or 1)))
 
 
+def square_name(square):
+    return chr(square % 8 + 97) + str(8 - square // 8)
 
-    def get_piece_symbol(self, value):
-        piece_mapping = {-4: 'r', -2: 'n', -3: 'b', -5: 'q', -6: 'k',
-                         -1: 'p', 1: "P", 4: 'R', 2: 'N', 3: 'B', 5: 'Q', 6: 'K'}
-        return piece_mapping.get(value, ' ')
+
+def parse_square(name):
+    if not name or name == '-':
+        return None
+    return (8 - int(name[1])) * 8 + ord(name[0]) - 97
+
+
+def encode_move(start, end, flags=QUIET):
+    return start | end << 6 | flags << 12
+
+
+def move_promotion(move):
+    # Unsigned code of the promotion piece, 0 if the move is not a promotion
+    return (move >> 12 & 3) + 2 if move >> 12 & PROMOTION else 0
+
+
+def move_to_uci(move):
+    return square_name(move & 63) + square_name(move >> 6 & 63) + PROMOTION_SYMBOLS.get(move_promotion(move), '')
+
+
+def move_from_uci(chessboard, text):
+    # The packed legal move for a UCI move string such as "e2e4" or "e7e8q", None if it is not legal
+    # or not a move string at all
+    if (len(text) not in (4, 5) or text[0] not in FILES or text[2] not in FILES or text[1] not in RANKS
+            or text[3] not in RANKS or text[4:] not in ('', *PROMOTION_SYMBOLS.values())):
+        return None
+    start, end = parse_square(text[0:2]), parse_square(text[2:4])
+    promotion = next((piece for piece, symbol in PROMOTION_SYMBOLS.items() if symbol == text[4:5]), None)
+    return chessboard.find_move(start, end, promotion)
 
 
 def get_king_position(chessboard, color):
-    for row in range(8):
-        for col in range(8):
-            piece = chessboard.board[row * 8 + col]
-            if color == 'w' and piece == 6:  # White king
-                return row, col
-            elif color == 'b' and piece == -6:  # Black king
-                return row, col
+    king_square = chessboard.king_squares[color]
     # If the king is not found, return None
-    return None, None
+    if king_square is None:
+        return None, None
+    return king_square // 8, king_square % 8
 
 
 def filter_safe_moves(chessboard, moves):
     safe_moves = set()
     if chessboard.selected_piece is not None:  # Check if a piece is selected
-        for move in moves:
-            # Create a temporary copy of the current board
-            temp_board = chessboard.board.copy()
-
-            # Simulate the move on the temporary board
-            original_piece = temp_board[move[0] * 8 + move[1]]
-            temp_board[move[0] * 8 + move[1]] = temp_board[
-                chessboard.selected_piece[0] * 8 + chessboard.selected_piece[1]]
-            temp_board[chessboard.selected_piece[0] * 8 + chessboard.selected_piece[1]] = 0
-
-            # Check if the king is under attack after the move
-            if not chessboard.is_king_under_attack(chessboard.active_color):
-                safe_moves.add(move)
-
-            # Discard the changes by restoring the original board state
-            temp_board[chessboard.selected_piece[0] * 8 + chessboard.selected_piece[1]] = temp_board[
-                move[0] * 8 + move[1]]
-            temp_board[move[0] * 8 + move[1]] = original_piece
+        legal_targets = chessboard.legal_targets(*chessboard.selected_piece)
+        safe_moves = {move for move in moves if move in legal_targets}
 
     return safe_moves
 
 
 def check_for_checkmate(chessboard):
-    for active_color in ['w', 'b']:
-        if chessboard.is_king_under_attack(active_color):
-            valid_moves_to_escape = []
-            for row in range(8):
-                for col in range(8):
-                    piece = chessboard.board[row * 8 + col]
-
-                    if (piece > 0 and active_color == 'w') or (piece < 0 and active_color == 'b'):
-                        valid_moves = chessboard.get_valid_moves(row, col)
-                        for move in valid_moves:
-                            start_square = chr(col + 97) + str(8 - row)
-                            end_square = chr(move[1] + 97) + str(8 - move[0])
-                            temp_board = chessboard.board.copy()
-
-                            temp_board[move[0] * 8 + move[1]] = temp_board[row * 8 + col]
-                            temp_board[row * 8 + col] = 0
-                            temp_chessboard = Chessboard()
-                            temp_chessboard.board = temp_board
-                            temp_chessboard.active_color = active_color
-                            if not temp_chessboard.is_king_under_attack(active_color):
-                                valid_moves_to_escape.append((start_square, end_square))
-            if valid_moves_to_escape:
-                #print(f"{active_color.upper()} Check!")
-                pass
-            else:
-                #print(f"{active_color.upper()} Checkmate!")
-                pass
-                return active_color  # Return the winning player
-        else:
-            pass
-
-def main():
-    pygame.init()
-    win = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption("Chess Game")
-    clock = pygame.time.Clock()
-
-    chessboard = Chessboard()
-    starting_fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
-    chessboard.initialize_board_from_fen(starting_fen)
-    run = True
-    font = pygame.font.SysFont(None, 36)
-
-    while run:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:  # Left mouse button clicked
-                    x, y = pygame.mouse.get_pos()
-                    row, col = chessboard.get_square(x, y)
-                    if chessboard.selected_piece is None:
-                        if chessboard.board[row * 8 + col] != 0:
-                            piece = chessboard.board[row * 8 + col]
-                            if (piece > 0 and chessboard.active_color == 'w') or (
-                                    piece < 0 and chessboard.active_color == 'b'):
-                                chessboard.selected_piece = (row, col)
-                                chessboard.valid_moves = chessboard.get_valid_moves(row, col)
-                    else:
-                        if (row, col) in chessboard.valid_moves:
-                            # Create a temporary copy of the chessboard to simulate the move
-                            temp_chessboard = deepcopy(chessboard)
-                            temp_chessboard.move_piece(row, col, win)
-                            # Check if the player's king is still under attack after the move
-                            if not temp_chessboard.is_king_under_attack(chessboard.active_color):
-                                # Move is valid, update the actual chessboard
-                                chessboard.move_piece(row, col, win)
-                                if chessboard.piece_moved:
-                                    chessboard.selected_piece = None
-                                    chessboard.valid_moves = {}
-                                    # Check for checkmate after each move
-                                    winner = check_for_checkmate(chessboard)
-                                    if winner:
-                                        print(f"Checkmate! {winner.upper()} Loses!")
-
-                                    else:
-                                        chessboard.switch_active_color()  # Switch active color after handling events and drawing the board
-                            else:
-                                pass
-                                # Optionally, you can provide feedback to the player that the move is invalid
-                        else:
-                            chessboard.selected_piece = None
-                            chessboard.valid_moves = {}
-
-        # If the player is in check, filter the valid moves to only allow moves that get out of check
-        if chessboard.is_king_under_attack(chessboard.active_color):
-            moves_to_remove = set()  # Create a set to store moves to be removed
-            for row, col in chessboard.valid_moves:
-                # Create a temporary copy of the chessboard to simulate the move
-                temp_chessboard = deepcopy(chessboard)
-                temp_chessboard.move_piece(row, col, win)
-                if temp_chessboard.is_king_under_attack(chessboard.active_color):
-                    # If the move still leaves the king under attack, add it to the set of moves to remove
-                    moves_to_remove.add((row, col))
-            # Remove invalid moves from the set of valid moves
-            for move in moves_to_remove:
-                chessboard.valid_moves.remove(move)
-
-        chessboard.draw_board(win)
-        chessboard.draw_pieces(win)
-
-        if check_for_checkmate(chessboard):
-            check_status = f"{check_for_checkmate(chessboard).capitalize()} Checkmate!"
-        elif chessboard.is_king_under_attack(chessboard.active_color):
-            check_status = f"{chessboard.active_color.capitalize()} Check"
-        else:
-            check_status = ""
-        check_text = font.render(check_status, True, BLACK)
-        win.blit(check_text, (20, HEIGHT - 60))
+    # Only the side to move can be mated; returns that side's color, the losing player
+    if chessboard.game_status().checkmate:
+        return chessboard.active_color
 
-        turn_text = font.render("Turn: White" if chessboard.active_color == 'w' else "Turn: Black", True, BLACK)
-        win.blit(turn_text, (20, HEIGHT - 30))
 
-        pygame.display.update()
-        clock.tick(60)
+def main(argv=None):
+    from gui import main as gui_main  # pygame is only imported when the GUI is actually started
+    gui_main(argv)
 
-    pygame.quit()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,117 @@
+import argparse
+import random
+import sys
+import time
+
+from chess import Chessboard, move_to_uci
+from evaluation import EG_SQUARE_TABLES, MG_SQUARE_TABLES, PHASE_BY_CODE, SQUARES
+from perft import POSITIONS
+from psqt import MAX_PHASE
+
+
+def zobrist_mismatch(chessboard):
+    key = chessboard.compute_zobrist_key()
+    if chessboard.zobrist_key != key:
+        return f"zobrist key {chessboard.zobrist_key:016x}, recomputed {key:016x}"
+    return None
+
+
+def scores_mismatch(chessboard):
+    scores = chessboard.compute_scores()
+    if (chessboard.mg_score, chessboard.eg_score, chessboard.phase) != scores:
+        return f"scores {(chessboard.mg_score, chessboard.eg_score, chessboard.phase)}, recomputed {scores}"
+    return None
+
+
+def evaluation_mismatch(chessboard):
+    # evaluate() against the material plus piece-square tables of the batch evaluator, tapered the same way
+    codes = chessboard.board + 6
+    phase = min(int(PHASE_BY_CODE[codes].sum()), MAX_PHASE)
+    mg = int(MG_SQUARE_TABLES[codes, SQUARES].sum())
+    eg = int(EG_SQUARE_TABLES[codes, SQUARES].sum())
+    blended = mg * phase + eg * (MAX_PHASE - phase)
+    expected = blended // MAX_PHASE if blended >= 0 else -(-blended // MAX_PHASE)
+    if chessboard.active_color == 'b':
+        expected = -expected
+    if chessboard.evaluate() != expected:
+        return f"evaluate() {chessboard.evaluate()}, batch material and piece-square score {expected}"
+    return None
+
+
+# (name, check) pairs; a check returns None when the incremental state agrees with a full recompute
+CHECKS = [("zobrist", zobrist_mismatch), ("scores", scores_mismatch), ("evaluate", evaluation_mismatch)]
+
+
+def random_walk(fen, plies, rng, checks=CHECKS):
+    # Play random legal moves from fen, taking one back now and then and unwinding to the start at the end,
+    # and run every check after each make_move and unmake_move. Returns (checks run, failure messages).
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(fen)
+    start_fen = chessboard.get_fen()
+    failures = []
+    runs = 0
+
+    def check(step):
+        nonlocal runs
+        for name, function in checks:
+            runs += 1
+            message = function(chessboard)
+            if message is not None:
+                line = ' '.join(move_to_uci(record.move) for record in chessboard.move_stack)
+                failures.append(f"{name} after {step}: {message}\n    {chessboard.get_fen()}  moves {line}")
+
+    check("setup")
+    for _ in range(plies):
+        moves = chessboard.legal_moves()
+        if chessboard.move_stack and (not moves or rng.random() < 0.2):
+            chessboard.unmake_move()
+            check("unmake_move")
+        elif moves:
+            chessboard.make_move(rng.choice(moves))
+            check("make_move")
+    while chessboard.move_stack:
+        chessboard.unmake_move()
+        check("unmake_move")
+    if chessboard.get_fen() != start_fen:
+        failures.append(f"unwound to {chessboard.get_fen()}, started from {start_fen}")
+    return runs, failures
+
+
+def run_walks(positions, walks, plies, seed, verbose=False):
+    # Random walks from every position; returns False if any incremental value disagreed
+    rng = random.Random(seed)
+    passed = True
+    for name, fen, _ in positions:
+        start = time.perf_counter()
+        runs = 0
+        failures = []
+        for _ in range(walks):
+            walk_runs, walk_failures = random_walk(fen, plies, rng)
+            runs += walk_runs
+            failures += walk_failures
+        status = "ok" if not failures else f"FAIL ({len(failures)} mismatches)"
+        print(f"{name:10} {walks} walks of {plies} plies  {runs:>8} checks  {time.perf_counter() - start:7.2f}s  "
+              f"{status}")
+        for message in failures[:None if verbose else 3]:
+            print(f"  {message}")
+        passed = passed and not failures
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the incrementally updated board state with full "
+                                                 "recomputes along random make/unmake walks")
+    parser.add_argument("--fen", help="Walk from a single position instead of the perft positions")
+    parser.add_argument("--walks", type=int, default=20, help="Walks per position")
+    parser.add_argument("--plies", type=int, default=200, help="Moves made or taken back per walk")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Print every mismatch, not just the first few")
+    args = parser.parse_args()
+
+    positions = [("fen", args.fen, None)] if args.fen else POSITIONS
+    if not run_walks(positions, args.walks, args.plies, args.seed, args.verbose):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import argparse
+import time
+
+import numpy as np
+
+import psqt
+from chess import BISHOP_DIRECTIONS, KING_TARGETS, KNIGHT_TARGETS, PAWN_CAPTURES, ROOK_DIRECTIONS, Chessboard
+from psqt import MAX_PHASE
+
+# Boards are stacked as (N, 64) int8 arrays of piece codes, laid out like Chessboard.board. Every score
+# is in centipawns from white's point of view unless the side to move is given.
+SQUARES = np.arange(64)
+
+# Middle and end game piece values, phase weights and piece-square tables, see psqt.py
+MG_VALUES = np.array(psqt.MG_VALUES)
+EG_VALUES = np.array(psqt.EG_VALUES)
+PHASE_WEIGHTS = np.array(psqt.PHASE_WEIGHTS)
+
+# Centipawns per attacked square that is not occupied by an own piece, indexed by the unsigned piece code
+MG_MOBILITY = np.array([0, 0, 4, 5, 2, 1, 0])
+EG_MOBILITY = np.array([0, 0, 4, 5, 4, 2, 0])
+
+# King safety, middle game only: bonus per own pawn in front of the king, penalty per enemy attack on
+# the squares around it
+SHIELD_BONUS = 10
+KING_ZONE_PENALTY = 8
+
+
+MG_SQUARE_TABLES = np.array(psqt.MG_SQUARE_TABLES, dtype=np.int32)
+EG_SQUARE_TABLES = np.array(psqt.EG_SQUARE_TABLES, dtype=np.int32)
+PHASE_BY_CODE = np.array(psqt.PHASE_BY_CODE)
+
+
+def _attack_matrix(targets):
+    # (64, 64) with [from, to] = 1, so that a piece mask times the matrix counts the attackers of every square.
+    # float32 so the product goes through BLAS; the counts are small integers and stay exact.
+    matrix = np.zeros((64, 64), dtype=np.float32)
+    for square, squares in enumerate(targets):
+        matrix[square, list(squares)] = 1
+    return matrix
+
+
+KNIGHT_MATRIX = _attack_matrix(KNIGHT_TARGETS)
+KING_MATRIX = _attack_matrix(KING_TARGETS)
+PAWN_MATRICES = {1: _attack_matrix(PAWN_CAPTURES[1]), -1: _attack_matrix(PAWN_CAPTURES[-1])}
+
+
+def _ray_steps(directions):
+    # Per direction the (from, to) square arrays of a single step, used to slide all pieces at once
+    steps = []
+    for d_row, d_col in directions:
+        sources, targets = [], []
+        for square in range(64):
+            row, col = divmod(square, 8)
+            if 0 <= row + d_row < 8 and 0 <= col + d_col < 8:
+                sources.append(square)
+                targets.append((row + d_row) * 8 + col + d_col)
+        steps.append((np.array(sources), np.array(targets)))
+    return steps
+
+
+DIAGONAL_STEPS = _ray_steps(BISHOP_DIRECTIONS)
+ORTHOGONAL_STEPS = _ray_steps(ROOK_DIRECTIONS)
+
+
+def _zone_masks():
+    # King square -> (squares around the king, white shield squares, black shield squares)
+    zone = KING_MATRIX.astype(bool)
+    zone[SQUARES, SQUARES] = True
+    shields = {}
+    for sign in (1, -1):
+        shield = np.zeros((64, 64), dtype=bool)
+        for square in range(64):
+            row, col = divmod(square, 8)
+            for ahead in (1, 2):
+                shield_row = row - sign * ahead
+                if 0 <= shield_row < 8:
+                    for shield_col in range(max(col - 1, 0), min(col + 2, 8)):
+                        shield[square, shield_row * 8 + shield_col] = True
+        shields[sign] = shield
+    return zone, shields
+
+
+KING_ZONES, PAWN_SHIELDS = _zone_masks()
+
+
+def stack_boards(chessboards):
+    # (N, 64) int8 array of the boards of Chessboard (or compatible) objects
+    return np.stack([np.asarray(chessboard.board, dtype=np.int8) for chessboard in chessboards])
+
+
+def boards_from_fens(fens):
+    # (N, 64) board array and (N,) bool white-to-move array, reloading one board for every FEN
+    chessboard = Chessboard()
+    boards = np.empty((len(fens), 64), dtype=np.int8)
+    white_to_move = np.empty(len(fens), dtype=bool)
+    for index, fen in enumerate(fens):
+        chessboard.initialize_board_from_fen(fen)
+        boards[index] = chessboard.board
+        white_to_move[index] = chessboard.active_color == 'w'
+    return boards, white_to_move
+
+
+def slider_attacks(boards, pieces, steps):
+    # (len(pieces), N, 64) number of pieces of each signed code attacking every square along the given
+    # directions, blocked by the first piece. All codes are slid together, square-major so that every
+    # step copies whole rows.
+    squares = np.ascontiguousarray(boards.T)
+    empty = (squares == 0)[:, None, :]
+    frontier = np.stack([squares == piece for piece in pieces], axis=1).astype(np.int16)
+    attacks = np.zeros(frontier.shape, dtype=np.int16)
+    for sources, targets in steps:
+        ray = frontier
+        for _ in range(7):
+            moved = np.zeros(frontier.shape, dtype=np.int16)
+            moved[targets] = ray[sources]
+            if not moved.any():
+                break
+            attacks += moved
+            ray = moved * empty
+    return attacks.transpose(1, 2, 0)
+
+
+def _leaper_attacks(boards, piece, matrix):
+    return ((boards == piece).astype(np.float32) @ matrix).astype(np.int16)
+
+
+def attack_maps(boards):
+    # Per piece code, the (N, 64) count of its attacks on every square
+    diagonal = slider_attacks(boards, (3, 5, -3, -5), DIAGONAL_STEPS)
+    orthogonal = slider_attacks(boards, (4, 5, -4, -5), ORTHOGONAL_STEPS)
+    maps = {3: diagonal[0], -3: diagonal[2], 4: orthogonal[0], -4: orthogonal[2],
+            5: diagonal[1] + orthogonal[1], -5: diagonal[3] + orthogonal[3]}
+    for sign in (1, -1):
+        maps[sign] = _leaper_attacks(boards, sign, PAWN_MATRICES[sign])
+        maps[2 * sign] = _leaper_attacks(boards, 2 * sign, KNIGHT_MATRIX)
+        maps[6 * sign] = _leaper_attacks(boards, 6 * sign, KING_MATRIX)
+    return maps
+
+
+def king_safety(boards, maps, sign):
+    # Middle game king safety of one color: pawn shield bonus minus a penalty for enemy attacks near the king
+    kings = boards == 6 * sign
+    has_king = kings.any(axis=1)
+    king_squares = kings.argmax(axis=1)
+    shield = (PAWN_SHIELDS[sign][king_squares] & (boards == sign)).sum(axis=1)
+    enemy_attacks = sum(maps[-kind * sign] for kind in range(1, 7))
+    zone_attacks = (enemy_attacks * KING_ZONES[king_squares]).sum(axis=1)
+    return np.where(has_king, shield * SHIELD_BONUS - zone_attacks * KING_ZONE_PENALTY, 0)
+
+
+def evaluate_features(boards):
+    # Dict of (N,) int arrays: phase, material, psqt and mobility (middle and end game each) and king safety
+    boards = np.asarray(boards, dtype=np.int8)
+    codes = boards.astype(np.intp) + 6
+    unsigned = np.abs(boards).astype(np.intp)
+    sign = np.sign(boards).astype(np.int32)
+
+    mg_total = MG_SQUARE_TABLES[codes, SQUARES].sum(axis=1)
+    eg_total = EG_SQUARE_TABLES[codes, SQUARES].sum(axis=1)
+    mg_material = (MG_VALUES[unsigned] * sign).sum(axis=1)
+    eg_material = (EG_VALUES[unsigned] * sign).sum(axis=1)
+
+    maps = attack_maps(boards)
+    own = {1: boards > 0, -1: boards < 0}
+    mg_mobility = np.zeros(len(boards), dtype=np.int32)
+    eg_mobility = np.zeros(len(boards), dtype=np.int32)
+    for piece, attacks in maps.items():
+        kind = abs(piece)
+        if MG_MOBILITY[kind] or EG_MOBILITY[kind]:
+            color = 1 if piece > 0 else -1
+            reachable = (attacks * ~own[color]).sum(axis=1)
+            mg_mobility += color * MG_MOBILITY[kind] * reachable
+            eg_mobility += color * EG_MOBILITY[kind] * reachable
+
+    return {
+        "phase": np.minimum(PHASE_BY_CODE[codes].sum(axis=1), MAX_PHASE),
+        "mg_material": mg_material,
+        "eg_material": eg_material,
+        "mg_psqt": mg_total - mg_material,
+        "eg_psqt": eg_total - eg_material,
+        "mg_mobility": mg_mobility,
+        "eg_mobility": eg_mobility,
+        "king_safety": king_safety(boards, maps, 1) - king_safety(boards, maps, -1),
+    }
+
+
+def evaluate_batch(boards, white_to_move=None):
+    # Tapered score of every board; from the side to move's point of view if white_to_move is given
+    features = evaluate_features(boards)
+    phase = features["phase"]
+    mg = features["mg_material"] + features["mg_psqt"] + features["mg_mobility"] + features["king_safety"]
+    eg = features["eg_material"] + features["eg_psqt"] + features["eg_mobility"]
+    blended = mg * phase + eg * (MAX_PHASE - phase)
+    scores = np.sign(blended) * (np.abs(blended) // MAX_PHASE)  # Round towards zero so colors stay symmetric
+    if white_to_move is not None:
+        scores = np.where(white_to_move, scores, -scores)
+    return scores
+
+
+def main():
+    from perft import POSITIONS
+
+    parser = argparse.ArgumentParser(description="Batch evaluation benchmark")
+    parser.add_argument("--fens", help="File with one FEN per line (default: the perft positions)")
+    parser.add_argument("--batch", type=int, default=4096, help="Positions per batch")
+    args = parser.parse_args()
+
+    if args.fens:
+        with open(args.fens, encoding='utf-8') as positions:
+            fens = [line.strip() for line in positions if line.strip()]
+    else:
+        fens = [fen for _, fen, _ in POSITIONS]
+    boards, white_to_move = boards_from_fens(fens)
+    boards = np.resize(boards, (max(args.batch, len(fens)), 64))
+    white_to_move = np.resize(white_to_move, len(boards))
+
+    start = time.perf_counter()
+    scores = evaluate_batch(boards, white_to_move)
+    batch_seconds = time.perf_counter() - start
+
+    single = boards[:min(len(boards), 256)]
+    start = time.perf_counter()
+    for index in range(len(single)):
+        evaluate_batch(single[index:index + 1], white_to_move[index:index + 1])
+    single_seconds = (time.perf_counter() - start) * len(boards) / len(single)
+
+    for fen, score in zip(fens[:10], scores):
+        print(f"{score:6}  {fen}")
+    print(f"batch of {len(boards)}  {batch_seconds:.3f}s  {len(boards) / batch_seconds:.0f} positions/s")
+    print(f"one by one      {single_seconds:.3f}s  {len(boards) / single_seconds:.0f} positions/s "
+          f"({single_seconds / batch_seconds:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+
+import pygame
+import numpy as np
+
+from book import OpeningBook
+from chess import START_FEN, Chessboard, move_from_uci, move_to_uci
+from profiling import PROFILER
+
+WIDTH, HEIGHT = 800, 1000
+SQUARE_SIZE = WIDTH // 8
+WHITE = (255, 255, 255)
+GREY = (128, 128, 128)
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+PIECE_NAMES = {1: "pawn", 2: "knight", 3: "bishop", 4: "rook", 5: "queen", 6: "king"}
+ENGINE_EVENT = pygame.USEREVENT + 1  # A line of engine output, posted by the EngineClient reader thread
+PROMOTION_CHOICES = (5, 2, 3, 4)  # Queen, knight, bishop and rook, in the order the arrow keys cycle through
+UCI_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uci.py")
+
+# Decoded piece PNGs, and the atlas of scaled sprites for the current square size
+_piece_sources = {}
+_piece_atlas = {"size": None, "surface": None, "images": {}}
+
+
+def _load_piece_source(piece):
+    image = _piece_sources.get(piece)
+    if image is None:
+        color = "white" if piece > 0 else "black"
+        image = pygame.image.load(f"static/{color}_{PIECE_NAMES[abs(piece)]}.png")
+        _piece_sources[piece] = image
+    return image
+
+
+def get_piece_images(size=None):
+    # Piece code -> sprite, all sprites packed side by side in one atlas surface. The PNGs are decoded
+    # once; the atlas is only rebuilt when the square size changes.
+    size = size or SQUARE_SIZE
+    if _piece_atlas["size"] == size:
+        return _piece_atlas["images"]
+
+    pieces = [kind * sign for sign in (1, -1) for kind in PIECE_NAMES]
+    atlas = pygame.Surface((size * len(pieces), size), pygame.SRCALPHA)
+    for index, piece in enumerate(pieces):
+        atlas.blit(pygame.transform.scale(_load_piece_source(piece), (size, size)), (index * size, 0))
+    if pygame.display.get_surface() is not None:
+        atlas = atlas.convert_alpha()  # Match the display format so blits need no conversion
+    _piece_atlas["size"] = size
+    _piece_atlas["surface"] = atlas
+    _piece_atlas["images"] = {piece: atlas.subsurface((index * size, 0, size, size))
+                              for index, piece in enumerate(pieces)}
+    return _piece_atlas["images"]
+
+
+def get_square(x, y):
+    col = x // SQUARE_SIZE
+    row = y // SQUARE_SIZE
+    return row, col
+
+
+def draw_board(win, chessboard):
+    win.fill(WHITE)
+    for row in range(8):
+        for col in range(8):
+            draw_square(win, chessboard, row, col)
+
+
+def shown_highlights(chessboard):
+    # Move highlights are hidden while the player picks a promotion piece
+    return chessboard.valid_moves if chessboard.promotion_square is None else {}
+
+
+def draw_square(win, chessboard, row, col):
+    # Background, move highlight and piece of a single square
+    light_green = (144, 238, 144)
+    dark_green = (0, 128, 0)
+    rect = (col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+    highlights = shown_highlights(chessboard)
+    if (row + col) % 2 == 0:
+        # Fill valid move squares with green-grey color
+        pygame.draw.rect(win, dark_green if (row, col) in highlights else GREY, rect)
+    else:
+        # Fill valid move squares with white-green color
+        pygame.draw.rect(win, light_green if (row, col) in highlights else WHITE, rect)
+    piece = chessboard.board[row * 8 + col]
+    if chessboard.promotion_square == (row, col):
+        # The promotion piece currently offered, in the color of the side to move
+        piece = chessboard.promotion_piece * (1 if chessboard.active_color == 'w' else -1)
+    if piece != 0:
+        win.blit(get_piece_images()[piece], rect[:2])
+    if chessboard.promotion_square == (row, col):
+        pygame.draw.rect(win, RED, rect, 3)
+
+
+def get_book_line(chessboard, book):
+    # The book moves of the position with their share of the weight, most played first
+    entries = book.legal_entries(chessboard) if book is not None else []
+    total = sum(entry.weight for entry in entries)
+    if not total:
+        return ""
+    return "Book: " + "  ".join(f"{move_to_uci(entry.move)} {entry.weight * 100 // total}%" for entry in entries[:5])
+
+
+class EngineClient:
+    # Runs uci.py in a child process. Its output is read on a thread and posted as ENGINE_EVENTs, so the
+    # event loop sleeps in pygame.event.wait() while the engine thinks and never blocks on it.
+    def __init__(self, color, movetime=1000, book_path=None):
+        self.color = color
+        self.movetime = movetime
+        self.thinking = False
+        self.info = ""
+        self.process = subprocess.Popen([sys.executable, UCI_SCRIPT], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.reader = threading.Thread(target=self.read_output, daemon=True)
+        self.reader.start()
+        self.send("uci")
+        if book_path:
+            self.send(f"setoption name BookFile value {os.path.abspath(book_path)}")
+        self.send("isready")
+
+    def send(self, line):
+        self.process.stdin.write(line + "\n")
+        self.process.stdin.flush()
+
+    def read_output(self):
+        for line in self.process.stdout:
+            pygame.event.post(pygame.event.Event(ENGINE_EVENT, line=line.strip()))
+
+    def wants_move(self, chessboard):
+        status = chessboard.game_status()
+        return (not self.thinking and chessboard.active_color == self.color
+                and not status.checkmate and not status.stalemate)
+
+    def go(self, chessboard):
+        # The GUI always starts from the initial position, so the moves played so far describe the game
+        moves = " ".join(move_to_uci(record.move) for record in chessboard.move_stack)
+        self.send(f"position startpos moves {moves}" if moves else "position startpos")
+        self.send(f"go movetime {self.movetime}")
+        self.thinking = True
+
+    def handle_line(self, chessboard, line):
+        # Play the engine's move on bestmove, keep the latest search info for the status area
+        tokens = line.split()
+        if tokens[:1] == ["info"] and "pv" in tokens:
+            fields = dict(zip(tokens[1::2], tokens[2::2]))
+            score = tokens[tokens.index("score") + 1:tokens.index("score") + 3] if "score" in tokens else []
+            self.info = (f"Engine: depth {fields.get('depth', '?')}  {' '.join(score)}  "
+                         f"pv {' '.join(tokens[tokens.index('pv') + 1:][:5])}")
+        elif tokens[:1] == ["bestmove"] and self.thinking:
+            self.thinking = False
+            move = move_from_uci(chessboard, tokens[1]) if len(tokens) > 1 else None
+            if move is not None:
+                chessboard.make_move(move)
+                chessboard.selected_piece = None
+                chessboard.valid_moves = {}
+
+    def close(self):
+        self.send("quit")
+        self.process.wait()
+
+
+def get_status_lines(chessboard, book=None, engine=None):
+    # Cached per position, so this is only computed again after a move
+    status = chessboard.game_status()
+    if status.checkmate:
+        check_status = f"{chessboard.active_color.capitalize()} Checkmate!"
+    elif status.stalemate:
+        check_status = "Stalemate"
+    elif status.in_check:
+        check_status = f"{chessboard.active_color.capitalize()} Check"
+    else:
+        check_status = ""
+    turn = "Turn: White" if chessboard.active_color == 'w' else "Turn: Black"
+    return engine.info if engine is not None else "", check_status, turn, get_book_line(chessboard, book)
+
+
+def draw_status(win, font, lines):
+    engine_line, check_status, turn, book_line = lines
+    win.blit(font.render(engine_line, True, BLACK), (20, HEIGHT - 120))
+    win.blit(font.render(book_line, True, BLACK), (20, HEIGHT - 90))
+    win.blit(font.render(check_status, True, BLACK), (20, HEIGHT - 60))
+    win.blit(font.render(turn, True, BLACK), (20, HEIGHT - 30))
+
+
+class BoardRenderer:
+    # Redraws only what changed since the previous frame and returns the rects to update on screen
+    def __init__(self, win, font, book=None, engine=None):
+        self.win = win
+        self.font = font
+        self.book = book
+        self.engine = engine
+        self.drawn_board = None
+        self.drawn_highlights = set()
+        self.drawn_promotion_square = None
+        self.drawn_promotion_piece = None
+        self.drawn_status = None
+
+    def invalidate(self):
+        # Something else drew over the window, repaint everything on the next render
+        self.drawn_board = None
+        self.drawn_status = None
+
+    def render(self, chessboard):
+        full = self.drawn_board is None
+        if full:
+            self.win.fill(WHITE)
+            dirty = range(64)
+            rects = [self.win.get_rect()]
+        else:
+            # Squares whose piece changed, plus highlights and the promotion marker that came or went
+            dirty = set(np.flatnonzero(chessboard.board != self.drawn_board).tolist())
+            dirty.update(row * 8 + col for row, col in set(shown_highlights(chessboard)) ^ self.drawn_highlights)
+            if (chessboard.promotion_square != self.drawn_promotion_square
+                    or chessboard.promotion_piece != self.drawn_promotion_piece):
+                for square in (chessboard.promotion_square, self.drawn_promotion_square):
+                    if square is not None:
+                        dirty.add(square[0] * 8 + square[1])
+            rects = []
+
+        for square in dirty:
+            row, col = divmod(square, 8)
+            draw_square(self.win, chessboard, row, col)
+            if not full:
+                rects.append(pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+
+        with PROFILER.section("status"):
+            lines = get_status_lines(chessboard, self.book, self.engine)
+        if lines != self.drawn_status:
+            status_rect = pygame.Rect(0, 8 * SQUARE_SIZE, WIDTH, HEIGHT - 8 * SQUARE_SIZE)
+            self.win.fill(WHITE, status_rect)
+            draw_status(self.win, self.font, lines)
+            rects.append(status_rect)
+
+        self.drawn_board = chessboard.board.copy()
+        self.drawn_highlights = set(shown_highlights(chessboard))
+        self.drawn_promotion_square = chessboard.promotion_square
+        self.drawn_promotion_piece = chessboard.promotion_piece
+        self.drawn_status = lines
+        return rects
+
+
+def handle_click(chessboard, row, col):
+    if chessboard.selected_piece is None:
+        if chessboard.board[row * 8 + col] != 0:
+            piece = chessboard.board[row * 8 + col]
+            if (piece > 0 and chessboard.active_color == 'w') or (
+                    piece < 0 and chessboard.active_color == 'b'):
+                chessboard.selected_piece = (row, col)
+                # Only legal moves are offered, so nothing needs to be filtered afterwards
+                chessboard.valid_moves = chessboard.legal_targets(row, col)
+    else:
+        if (row, col) in chessboard.valid_moves:
+            if chessboard.needs_promotion(row, col):
+                # Offer the promotion pieces on the target square, the keys pick one in the main loop
+                chessboard.promotion_square = (row, col)
+                chessboard.promotion_piece = PROMOTION_CHOICES[0]
+            else:
+                play_selected_move(chessboard, row, col)
+        else:
+            chessboard.selected_piece = None
+            chessboard.valid_moves = {}
+
+
+def handle_promotion_key(chessboard, key):
+    # Left and right cycle through the promotion pieces, return plays the move, escape takes it back
+    index = PROMOTION_CHOICES.index(chessboard.promotion_piece)
+    if key == pygame.K_LEFT:
+        chessboard.promotion_piece = PROMOTION_CHOICES[(index - 1) % len(PROMOTION_CHOICES)]
+    elif key == pygame.K_RIGHT:
+        chessboard.promotion_piece = PROMOTION_CHOICES[(index + 1) % len(PROMOTION_CHOICES)]
+    elif key in (pygame.K_RETURN, pygame.K_ESCAPE):
+        (row, col), promotion = chessboard.promotion_square, chessboard.promotion_piece
+        chessboard.promotion_square = chessboard.promotion_piece = None
+        if key == pygame.K_RETURN:
+            play_selected_move(chessboard, row, col, promotion)
+
+
+def play_selected_move(chessboard, row, col, promotion=None):
+    chessboard.move_piece(row, col, promotion)
+    if chessboard.piece_moved:
+        chessboard.selected_piece = None
+        chessboard.valid_moves = {}
+        # Check for checkmate after each move
+        if chessboard.game_status().checkmate:
+            print(f"Checkmate! {chessboard.active_color.upper()} Loses!")
+
+        else:
+            # make_move already passed the turn, only reset the per-turn flags
+            chessboard.piece_moved = False
+            chessboard.move_made = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chess Game")
+    parser.add_argument("--full-redraw", action="store_true",
+                        help="Repaint the whole window at 60 fps instead of only the changed squares on input")
+    parser.add_argument("--book", help="Opening book built by book.py, its moves are listed under the board")
+    parser.add_argument("--engine", choices=("white", "black"), help="Let the UCI engine play this side")
+    parser.add_argument("--engine-movetime", type=int, default=1000, help="Engine thinking time per move in ms")
+    parser.add_argument("--profile", action="store_true",
+                        help="Count and time the rules hot paths and the parts of every frame, report on exit")
+    parser.add_argument("--profile-every", type=int, default=0, metavar="N",
+                        help="With --profile, also print a stats line every N frames")
+    args = parser.parse_args(argv)
+    book = OpeningBook(args.book) if args.book else None
+    if args.profile:
+        PROFILER.enable()
+
+    pygame.init()
+    win = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("Chess Game")
+    clock = pygame.time.Clock()
+
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(START_FEN)
+    run = True
+    font = pygame.font.SysFont(None, 36)
+    engine = EngineClient(args.engine[0], args.engine_movetime, args.book) if args.engine else None
+    renderer = BoardRenderer(win, font, book, engine)
+
+    while run:
+        if engine is not None and engine.wants_move(chessboard):
+            engine.go(chessboard)
+        if args.full_redraw:
+            with PROFILER.section("draw"):  # Includes the status section
+                draw_board(win, chessboard)
+                with PROFILER.section("status"):
+                    lines = get_status_lines(chessboard, book, engine)
+                draw_status(win, font, lines)
+                pygame.display.update()
+            clock.tick(60)
+            events = pygame.event.get()
+        else:
+            with PROFILER.section("draw"):  # Includes the status section
+                rects = renderer.render(chessboard)
+                if rects:
+                    pygame.display.update(rects)
+            # Sleep until there is input instead of polling
+            events = [pygame.event.wait()] + pygame.event.get()
+
+        with PROFILER.section("events"):
+            for event in events:
+                if event.type == pygame.QUIT:
+                    run = False
+                elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    renderer.invalidate()
+                elif event.type == ENGINE_EVENT:
+                    engine.handle_line(chessboard, event.line)
+                elif event.type == pygame.KEYDOWN:
+                    if chessboard.promotion_square is not None:
+                        handle_promotion_key(chessboard, event.key)
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    if engine is not None and chessboard.active_color == engine.color:
+                        continue  # The engine is to move
+                    if chessboard.promotion_square is not None:
+                        continue  # Pick the promotion piece with the keys first
+                    if event.button == 1:  # Left mouse button clicked
+                        x, y = pygame.mouse.get_pos()
+                        row, col = get_square(x, y)
+                        if row > 7:
+                            continue  # Click on the status area
+                        handle_click(chessboard, row, col)
+
+        PROFILER.end_frame()
+        if args.profile_every and PROFILER.frames % args.profile_every == 0 and PROFILER.enabled:
+            print(PROFILER.stats_line())
+
+    if engine is not None:
+        engine.close()
+    pygame.quit()
+    if args.profile:
+        PROFILER.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from analysis import iter_positions
+from chess import START_FEN, Chessboard
+from pgn import move_to_san
+from search import Searcher
+from transposition import TranspositionTable
+
+# One finished game. latencies are the seconds each player took per move, white's and black's, and
+# first_is_white tells which match player had white, the specs alone do not when both play the same one.
+GameRecord = namedtuple("GameRecord", "number white black first_is_white fen result termination moves "
+                                      "white_latencies black_latencies")
+MatchStats = namedtuple("MatchStats", "games wins draws losses elapsed")
+
+FIFTY_MOVE_PLIES = 100
+PGN_LINE_LENGTH = 80
+
+
+def parse_player(spec):
+    # "random", "depth:N" (engine searching N plies) or "time:MS" (engine thinking MS milliseconds a move)
+    kind, _, value = spec.partition(':')
+    if kind == 'random' and not value:
+        return kind, None
+    if kind in ('depth', 'time') and value.isdigit() and int(value) > 0:
+        return kind, int(value)
+    raise ValueError(f"Unknown player {spec!r}, expected random, depth:N or time:MS")
+
+
+class Player:
+    def __init__(self, spec, seed, hash_mb=16):
+        self.kind, self.value = parse_player(spec)
+        self.random = random.Random(seed)
+        self.table = TranspositionTable(hash_mb) if self.kind != 'random' else None
+
+    def choose_move(self, chessboard):
+        if self.kind == 'random':
+            return self.random.choice(chessboard.legal_moves())
+        searcher = Searcher(chessboard, self.table)
+        if self.kind == 'depth':
+            return searcher.search(max_depth=self.value).best_move
+        return searcher.search(time_limit=self.value / 1000).best_move
+
+
+def repetitions(chessboard):
+    # How often the current position occurred before, looking back to the last capture or pawn move
+    key = chessboard.zobrist_key
+    reversible = chessboard.move_stack[-1:-chessboard.halfmove_clock - 1:-1]
+    return sum(1 for record in reversible if record.zobrist_key == key)
+
+
+def insufficient_material(chessboard):
+    # Only kings left, or kings and a single bishop or knight
+    pieces = [abs(piece) for piece in chessboard.board.tolist() if piece != 0 and abs(piece) != 6]
+    return not pieces or pieces in ([2], [3])
+
+
+def adjudicate(chessboard, max_plies):
+    # (result, termination) once the game is over, None while it goes on
+    status = chessboard.game_status()
+    if status.checkmate:
+        return ('1-0' if status.winner == 'w' else '0-1'), "checkmate"
+    if status.stalemate:
+        return '1/2-1/2', "stalemate"
+    if chessboard.halfmove_clock >= FIFTY_MOVE_PLIES:
+        return '1/2-1/2', "fifty-move rule"
+    if repetitions(chessboard) >= 2:
+        return '1/2-1/2', "threefold repetition"
+    if insufficient_material(chessboard):
+        return '1/2-1/2', "insufficient material"
+    if len(chessboard.move_stack) >= max_plies:
+        return '*', "ply limit"
+    return None
+
+
+def play_game(task):
+    # Runs in a worker process; everything in the task and the GameRecord is small and picklable
+    number, white, black, first_is_white, fen, seed, hash_mb, max_plies = task
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(fen)
+    if chessboard.halfmove_clock is None:  # EPD openings have no clocks
+        chessboard.halfmove_clock, chessboard.fullmove_number = 0, 1
+    fen = chessboard.get_fen()
+    players = {'w': Player(white, seed, hash_mb), 'b': Player(black, seed + 1, hash_mb)}
+    latencies = {'w': [], 'b': []}
+    moves = []
+    while True:
+        outcome = adjudicate(chessboard, max_plies)
+        if outcome is not None:
+            break
+        color = chessboard.active_color
+        start = time.perf_counter()
+        move = players[color].choose_move(chessboard)
+        latencies[color].append(time.perf_counter() - start)
+        moves.append(move_to_san(chessboard, move))
+        chessboard.make_move(move)
+    return GameRecord(number, white, black, first_is_white, fen, outcome[0], outcome[1], moves, latencies['w'],
+                      latencies['b'])
+
+
+def format_pgn(record, event="Self-play match"):
+    fen_headers = f'[FEN "{record.fen}"]\n[SetUp "1"]\n' if record.fen != START_FEN else ''
+    headers = (f'[Event "{event}"]\n[Site "?"]\n[Date "{time.strftime("%Y.%m.%d")}"]\n[Round "{record.number}"]\n'
+               f'[White "{record.white}"]\n[Black "{record.black}"]\n[Result "{record.result}"]\n'
+               f'{fen_headers}[Termination "{record.termination}"]\n[PlyCount "{len(record.moves)}"]\n')
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(record.fen)
+    number = chessboard.fullmove_number or 1
+    tokens = []
+    white_to_move = chessboard.active_color == 'w'
+    for index, san in enumerate(record.moves):
+        if white_to_move:
+            tokens.append(f"{number}.")
+        elif index == 0:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+        if not white_to_move:
+            number += 1
+        white_to_move = not white_to_move
+    tokens.append(record.result)
+    lines, line = [], ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > PGN_LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return headers + '\n' + '\n'.join(lines) + '\n\n'
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def game_tasks(games, first, second, openings, seed, hash_mb, max_plies):
+    # Each opening is played twice with the colors swapped, so neither player gets the better side more often
+    for number in range(1, games + 1):
+        fen = openings[(number - 1) // 2 % len(openings)]
+        first_is_white = number % 2 == 1
+        white, black = (first, second) if first_is_white else (second, first)
+        yield number, white, black, first_is_white, fen, seed + number * 2, hash_mb, max_plies
+
+
+def run_match(first, second, games, workers=None, openings=(START_FEN,), pgn=None, seed=1, hash_mb=16,
+              max_plies=400, log=sys.stdout):
+    # Play the games on a process pool, writing PGN in game order and reporting results from the first
+    # player's point of view
+    start = time.perf_counter()
+    wins = draws = losses = 0
+    latencies = {'first': [], 'second': []}  # By match slot, so self-play keeps both players apart
+    finished = {}
+    next_number = 1
+    completed = 0
+    with ProcessPoolExecutor(workers or os.cpu_count() or 1) as executor:
+        futures = [executor.submit(play_game, task)
+                   for task in game_tasks(games, first, second, list(openings), seed, hash_mb, max_plies)]
+        for future in as_completed(futures):
+            record = future.result()
+            first_latencies, second_latencies = ((record.white_latencies, record.black_latencies)
+                                                 if record.first_is_white else
+                                                 (record.black_latencies, record.white_latencies))
+            latencies['first'].extend(first_latencies)
+            latencies['second'].extend(second_latencies)
+            if record.result == '1/2-1/2':
+                draws += 1
+            elif record.result in ('1-0', '0-1'):
+                if (record.result == '1-0') == record.first_is_white:
+                    wins += 1
+                else:
+                    losses += 1
+            completed += 1
+            elapsed = time.perf_counter() - start
+            print(f"game {record.number:4}  {record.white} - {record.black}  {record.result:7}  "
+                  f"{record.termination:21}  {len(record.moves):3} plies  "
+                  f"+{wins} ={draws} -{losses}  {completed * 3600 / elapsed:.0f} games/hour", file=log)
+            finished[record.number] = record
+            while next_number in finished:
+                if pgn is not None:
+                    pgn.write(format_pgn(finished.pop(next_number)))
+                else:
+                    finished.pop(next_number)
+                next_number += 1
+
+    elapsed = time.perf_counter() - start
+    for slot, name in (('first', first), ('second', second)):
+        values = sorted(latencies[slot])
+        print(f"{slot:6} {name:10} {len(values):6} moves  latency ms  p50 {percentile(values, 0.5) * 1000:.1f}  "
+              f"p90 {percentile(values, 0.9) * 1000:.1f}  p99 {percentile(values, 0.99) * 1000:.1f}  "
+              f"max {(values[-1] if values else 0.0) * 1000:.1f}", file=log)
+    return MatchStats(games, wins, draws, losses, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play games between two players on a process pool")
+    parser.add_argument("first", help="random, depth:N or time:MS")
+    parser.add_argument("second", help="random, depth:N or time:MS")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    parser.add_argument("--openings", help="FEN/EPD file of start positions, each is played with both colors")
+    parser.add_argument("--pgn", help="Write the games to this PGN file")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the random players")
+    parser.add_argument("--hash", type=int, default=16, metavar="MB", help="Transposition table per engine player")
+    parser.add_argument("--max-plies", type=int, default=400, help="Stop unfinished games after this many plies")
+    args = parser.parse_args()
+
+    for spec in (args.first, args.second):
+        try:
+            parse_player(spec)
+        except ValueError as error:
+            parser.error(str(error))
+    openings = [START_FEN]
+    if args.openings:
+        with open(args.openings, encoding='utf-8') as lines:
+            openings = [' '.join(fields) for _, fields, _ in iter_positions(lines)]
+        if not openings:
+            parser.error(f"no positions in {args.openings}")
+
+    pgn = open(args.pgn, 'w', encoding='utf-8') if args.pgn else None
+    try:
+        stats = run_match(args.first, args.second, args.games, args.workers, openings, pgn, args.seed, args.hash,
+                          args.max_plies)
+    finally:
+        if pgn is not None:
+            pgn.close()
+    played = stats.wins + stats.draws + stats.losses
+    score = (stats.wins + stats.draws / 2) / played if played else 0.0
+    print(f"{args.first} vs {args.second}: +{stats.wins} ={stats.draws} -{stats.losses}  score {score:.1%}  "
+          f"{stats.games} games in {stats.elapsed:.1f}s  {stats.games * 3600 / stats.elapsed:.0f} games/hour")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis import AnalysisStats, analyse_position, format_result, iter_positions, open_positions
+from chess import Chessboard, move_to_uci
+from perft import POSITIONS, hashed_perft
+from transposition import TranspositionTable
+
+# Each worker process keeps one board and reloads it for every task. Tasks only carry a FEN plus the
+# moves played from it, so nothing but short strings and small int tuples is pickled.
+_worker_board = None
+
+
+def _get_worker_board():
+    global _worker_board
+    if _worker_board is None:
+        _worker_board = Chessboard()
+    return _worker_board
+
+
+def _perft_task(task):
+    fen, moves, depth, hash_mb = task
+    chessboard = _get_worker_board()
+    chessboard.initialize_board_from_fen(fen)
+    for move in moves:
+        chessboard.make_move(move)
+    if hash_mb:
+        return hashed_perft(chessboard, depth, TranspositionTable(hash_mb))
+    return chessboard.perft(depth)
+
+
+def _analysis_task(task):
+    # Formatted result lines of one chunk, with its position, error and mismatch counts
+    first_line_number, lines = task
+    chessboard = _get_worker_board()
+    text = []
+    errors = mismatches = 0
+    for line_number, fields, opcodes in iter_positions(lines, first_line_number):
+        result = analyse_position(chessboard, line_number, fields, opcodes)
+        if result.error is not None:
+            errors += 1
+        elif not result.round_trip:
+            mismatches += 1
+        text.append(format_result(result))
+    return ''.join(text), len(text), errors, mismatches
+
+
+def split_perft(fen, depth, split_depth=1):
+    # One task per move sequence of split_depth plies, as (fen, moves, remaining depth). Sequences that
+    # end in mate or stalemate before split_depth are kept with their remaining depth, where perft is 0.
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(fen)
+    tasks = []
+
+    def expand(moves, remaining, plies):
+        if plies == 0 or remaining <= 1:
+            tasks.append((fen, tuple(moves), remaining))
+            return
+        legal_moves = chessboard.legal_moves()
+        if not legal_moves:
+            if moves:  # Mate or stalemate, keep the task so divide still lists its root move
+                tasks.append((fen, tuple(moves), remaining))
+            return
+        for move in legal_moves:
+            chessboard.make_move(move)
+            expand(moves + [move], remaining - 1, plies - 1)
+            chessboard.unmake_move()
+
+    expand([], depth, min(split_depth, depth - 1))
+    return tasks
+
+
+def parallel_divide(fen, depth, workers=None, split_depth=1, hash_mb=0):
+    # perft split by root move like Chessboard.divide, with the subtrees counted in a process pool.
+    # Results come back in task order, so the merged counts do not depend on scheduling.
+    if depth < 2:
+        chessboard = Chessboard()
+        chessboard.initialize_board_from_fen(fen)
+        return chessboard.divide(depth)
+    tasks = split_perft(fen, depth, max(1, split_depth))
+    results = {}
+    with ProcessPoolExecutor(workers) as executor:
+        counts = executor.map(_perft_task, [task + (hash_mb,) for task in tasks])
+        for (_, moves, _), nodes in zip(tasks, counts):
+            root = move_to_uci(moves[0])
+            results[root] = results.get(root, 0) + nodes
+    return results
+
+
+def parallel_perft(fen, depth, workers=None, split_depth=1, hash_mb=0):
+    return sum(parallel_divide(fen, depth, workers, split_depth, hash_mb).values())
+
+
+def _chunks(lines, chunk_size):
+    # (number of the first line, lines) in chunks of chunk_size lines
+    chunk = []
+    first_line_number = 1
+    for line_number, line in enumerate(lines, 1):
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield first_line_number, chunk
+            chunk = []
+            first_line_number = line_number + 1
+    if chunk:
+        yield first_line_number, chunk
+
+
+def parallel_analysis(lines, output, workers=None, chunk_size=2000, progress=0, log=sys.stderr):
+    # analysis.run_analysis over a process pool. Only a bounded number of chunks is in flight so huge
+    # inputs are streamed, and the chunks are written back in input order.
+    workers = workers or os.cpu_count() or 1
+    positions = errors = mismatches = 0
+    next_report = progress
+    start = time.perf_counter()
+    pending = deque()
+
+    def write(future):
+        nonlocal positions, errors, mismatches, next_report
+        text, chunk_positions, chunk_errors, chunk_mismatches = future.result()
+        output.write(text)
+        positions += chunk_positions
+        errors += chunk_errors
+        mismatches += chunk_mismatches
+        if progress and positions >= next_report:
+            next_report += progress
+            elapsed = time.perf_counter() - start
+            print(f"{positions} positions  {elapsed:.1f}s  {positions / elapsed:.0f} positions/s", file=log)
+
+    with ProcessPoolExecutor(workers) as executor:
+        for task in _chunks(lines, chunk_size):
+            pending.append(executor.submit(_analysis_task, task))
+            if len(pending) >= workers * 4:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+    return AnalysisStats(positions, errors, mismatches, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run perft or FEN/EPD analysis on a process pool")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    perft_parser = commands.add_parser("perft", help="perft split at the root moves")
+    perft_parser.add_argument("--fen", help="Position to count (default: the standard perft positions)")
+    perft_parser.add_argument("--position", choices=[name for name, _, _ in POSITIONS])
+    perft_parser.add_argument("--depth", type=int, default=4)
+    perft_parser.add_argument("--split-depth", type=int, default=1,
+                              help="Plies expanded before handing out tasks, 2 gives finer grained work")
+    perft_parser.add_argument("--divide", action="store_true", help="Print the node count of every root move")
+    perft_parser.add_argument("--hash", type=int, default=0, metavar="MB",
+                              help="Transposition table per task for the subtree counts")
+
+    analyse_parser = commands.add_parser("analyse", help="Validate a FEN/EPD file, see analysis.py")
+    analyse_parser.add_argument("input", nargs="?", default="-")
+    analyse_parser.add_argument("-o", "--output", default="-")
+    analyse_parser.add_argument("--chunk-size", type=int, default=2000, help="Lines per task")
+    analyse_parser.add_argument("--progress", type=int, default=100000, metavar="N")
+    args = parser.parse_args()
+
+    if args.command == "perft":
+        if args.fen:
+            positions = [("fen", args.fen, [])]
+        else:
+            positions = [position for position in POSITIONS if args.position in (None, position[0])]
+        passed = True
+        for name, fen, expected in positions:
+            start = time.perf_counter()
+            results = parallel_divide(fen, args.depth, args.workers, args.split_depth, args.hash)
+            seconds = time.perf_counter() - start
+            nodes = sum(results.values())
+            if args.divide:
+                for move in sorted(results):
+                    print(f"{move}: {results[move]}")
+            status = ""
+            if args.depth <= len(expected):
+                status = "ok" if nodes == expected[args.depth - 1] else f"FAIL (expected {expected[args.depth - 1]})"
+                passed = passed and nodes == expected[args.depth - 1]
+            print(f"{name:10} depth {args.depth}  {nodes:>10} nodes  {seconds:7.2f}s  {nodes / seconds:>9.0f} nps  "
+                  f"{status}")
+        if not passed:
+            sys.exit(1)
+        return
+
+    lines = open_positions(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', buffering=1 << 20)
+    try:
+        stats = parallel_analysis(lines, output, args.workers, args.chunk_size, args.progress)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        if output is not sys.stdout:
+            output.close()
+    rate = stats.positions / stats.elapsed if stats.elapsed else 0.0
+    print(f"{stats.positions} positions  {stats.errors} errors  {stats.mismatches} round trip mismatches  "
+          f"{stats.elapsed:.2f}s  {rate:.0f} positions/s", file=sys.stderr)
+    if stats.errors or stats.mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import atexit
+import sys
+import time
+
+from chess import Chessboard
+from profiling import PROFILER
+from transposition import TranspositionTable
+
+# Standard perft positions with their known node counts for depth 1, 2, ...
+POSITIONS = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def hashed_perft(chessboard, depth, table):
+    # perft that reuses subtree counts of transposed positions from the table
+    if depth <= 1:
+        return chessboard.perft(depth)
+    cached = table.probe(chessboard.zobrist_key)
+    if cached is not None and cached[0] == depth:
+        return cached[1]
+    nodes = 0
+    for move in chessboard.legal_moves():
+        chessboard.make_move(move)
+        nodes += hashed_perft(chessboard, depth - 1, table)
+        chessboard.unmake_move()
+    table.store(chessboard.zobrist_key, (depth, nodes), depth)
+    return nodes
+
+
+def run_perft(fen, depth, table=None):
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(fen)
+    start = time.perf_counter()
+    if table is not None:
+        nodes = hashed_perft(chessboard, depth, table)
+    else:
+        nodes = chessboard.perft(depth)
+    return nodes, time.perf_counter() - start
+
+
+def run_divide(fen, depth):
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(fen)
+    results = chessboard.divide(depth)
+    for move in sorted(results):
+        print(f"{move}: {results[move]}")
+    print(f"\nMoves: {len(results)}")
+    print(f"Nodes: {sum(results.values())}")
+
+
+def run_suite(positions, depth, max_nodes, hash_mb=0):
+    # Run every position at the requested depth (or the deepest one within max_nodes) and
+    # compare with the known counts. Returns False if any count is wrong.
+    passed = True
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, expected in positions:
+        if depth is not None:
+            position_depth = min(depth, len(expected))
+        else:
+            position_depth = max([d for d, count in enumerate(expected, 1) if count <= max_nodes] or [1])
+        table = TranspositionTable(hash_mb) if hash_mb else None
+        nodes, seconds = run_perft(fen, position_depth, table)
+        total_nodes += nodes
+        total_time += seconds
+        status = "ok" if nodes == expected[position_depth - 1] else f"FAIL (expected {expected[position_depth - 1]})"
+        if nodes != expected[position_depth - 1]:
+            passed = False
+        print(f"{name:10} depth {position_depth}  {nodes:>9} nodes  {seconds:7.2f}s  "
+              f"{nodes / seconds:>9.0f} nps  {status}")
+    print(f"{'total':10}          {total_nodes:>9} nodes  {total_time:7.2f}s  {total_nodes / total_time:>9.0f} nps")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft move generator check and benchmark")
+    parser.add_argument("--fen", help="Run a single position instead of the standard suite")
+    parser.add_argument("--position", choices=[name for name, _, _ in POSITIONS],
+                        help="Run only one of the standard positions")
+    parser.add_argument("--depth", type=int, help="Search depth (default: deepest within --max-nodes)")
+    parser.add_argument("--max-nodes", type=int, default=100000)
+    parser.add_argument("--divide", action="store_true", help="Print the node count of every root move")
+    parser.add_argument("--hash", type=int, default=0, metavar="MB",
+                        help="Cache subtree counts in a transposition table of this size")
+    parser.add_argument("--profile", action="store_true", help="Count and time the rules hot paths, report at the end")
+    args = parser.parse_args()
+    if args.profile:
+        PROFILER.enable()
+        atexit.register(PROFILER.report)
+
+    if args.fen:
+        depth = args.depth or 3
+        if args.divide:
+            run_divide(args.fen, depth)
+        else:
+            nodes, seconds = run_perft(args.fen, depth, TranspositionTable(args.hash) if args.hash else None)
+            print(f"depth {depth}  {nodes} nodes  {seconds:.2f}s  {nodes / seconds:.0f} nps")
+        return
+
+    positions = [position for position in POSITIONS if args.position in (None, position[0])]
+    if args.divide:
+        for name, fen, expected in positions:
+            run_divide(fen, args.depth or 2)
+        return
+    if not run_suite(positions, args.depth, args.max_nodes, args.hash):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import argparse
+import heapq
+import os
+import re
+import sys
+import tempfile
+import time
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from chess import (CAPTURE, KING_CASTLE, PROMOTION, QUEEN_CASTLE, START_FEN, Chessboard, move_promotion, parse_square,
+                   square_name)
+
+# offset is the byte offset of the game's first line in the PGN file, moves its SAN tokens
+Game = namedtuple("Game", "offset headers moves result")
+IndexStats = namedtuple("IndexStats", "games positions errors elapsed")
+
+TAG_PATTERN = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+COMMENT_PATTERN = re.compile(r'\{[^}]*\}|;[^\n]*')
+VARIATION_PATTERN = re.compile(r'\([^()]*\)')
+NAG_PATTERN = re.compile(r'\$\d+')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+')
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+SAN_PIECES = {'N': 2, 'B': 3, 'R': 4, 'Q': 5, 'K': 6}
+SAN_SYMBOLS = {piece: symbol for symbol, piece in SAN_PIECES.items()}
+
+# Index file: magic, record count, then the columns keys (uint64, sorted), offsets (uint64) and plies (uint16),
+# so the keys can be binary searched straight from the memory map
+INDEX_MAGIC = b'CHESSIDX'
+INDEX_HEADER_BYTES = 16
+
+
+def iter_games(stream):
+    # Games of a PGN file opened in binary mode, read line by line so files of any size can be streamed
+    offset = 0
+    game_offset = None
+    headers = {}
+    movetext = []
+    for raw_line in stream:
+        line_offset = offset
+        offset += len(raw_line)
+        line = raw_line.decode('utf-8', errors='replace').strip()
+        if line.startswith('['):
+            if movetext:
+                # A tag after movetext starts the next game even without a blank line in between
+                yield parse_game(game_offset, headers, movetext)
+                headers, movetext, game_offset = {}, [], None
+            match = TAG_PATTERN.match(line)
+            if match:
+                if game_offset is None:
+                    game_offset = line_offset
+                headers[match.group(1)] = match.group(2)
+        elif line and not line.startswith('%'):
+            if game_offset is None:
+                game_offset = line_offset
+            movetext.append(line)
+    if headers or movetext:
+        yield parse_game(game_offset, headers, movetext)
+
+
+def parse_game(offset, headers, movetext):
+    text = COMMENT_PATTERN.sub(' ', '\n'.join(movetext))
+    previous = None
+    while previous != text:  # Variations nest, strip the innermost ones until none are left
+        previous = text
+        text = VARIATION_PATTERN.sub(' ', text)
+    moves = []
+    result = headers.get('Result', '*')
+    for token in NAG_PATTERN.sub(' ', text).split():
+        token = MOVE_NUMBER_PATTERN.sub('', token)
+        if not token or token == 'e.p.':
+            continue
+        if token in RESULTS:
+            result = token
+        else:
+            moves.append(token)
+    return Game(offset, headers, moves, result)
+
+
+def read_game(stream, offset):
+    # The game starting at offset, as stored in the index
+    stream.seek(offset)
+    return next(iter_games(stream))
+
+
+def parse_san(chessboard, san):
+    # The packed legal move for a SAN move in the current position; ValueError if it is illegal or ambiguous
+    text = san.rstrip('+#!?')
+    candidates = array('H')
+    chessboard.generate_pseudo_legal_moves(candidates)
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        flags = KING_CASTLE if len(text) == 3 else QUEEN_CASTLE
+        matches = [move for move in candidates if move >> 12 == flags]
+    else:
+        promotion = 0
+        if '=' in text:
+            text, symbol = text.split('=', 1)
+            promotion = SAN_PIECES.get(symbol[:1].upper(), -1)
+        elif text[-1:] in 'QRBN' and len(text) > 2 and text[-2].isdigit():
+            promotion = SAN_PIECES[text[-1]]
+            text = text[:-1]
+        kind = SAN_PIECES.get(text[:1], 1)
+        if kind != 1:
+            text = text[1:]
+        end = parse_square(text[-2:]) if len(text) >= 2 and text[-2] in 'abcdefgh' and text[-1] in '12345678' \
+            else None
+        if end is None:
+            raise ValueError(f"Cannot parse SAN move {san!r}")
+        hint = text[:-2].replace('x', '')
+        hint_file = next((ord(char) - 97 for char in hint if char in 'abcdefgh'), None)
+        hint_rank = next((8 - int(char) for char in hint if char in '12345678'), None)
+        board = chessboard.board
+        matches = []
+        for move in candidates:
+            start = move & 63
+            if (move >> 6 & 63 != end or abs(board[start]) != kind or move_promotion(move) != promotion
+                    or hint_file is not None and start % 8 != hint_file
+                    or hint_rank is not None and start // 8 != hint_rank):
+                continue
+            matches.append(move)
+    matches = [move for move in matches if chessboard.leaves_king_safe(move)]
+    if len(matches) != 1:
+        raise ValueError(f"{'Ambiguous' if matches else 'Illegal'} SAN move {san!r} in {chessboard.get_fen()}")
+    return matches[0]
+
+
+def move_to_san(chessboard, move):
+    # SAN of a legal packed move in the current position, with the check or mate suffix
+    flags = move >> 12
+    start, end = move & 63, move >> 6 & 63
+    if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+        text = 'O-O' if flags == KING_CASTLE else 'O-O-O'
+    else:
+        kind = abs(int(chessboard.board[start]))
+        capture = 'x' if flags & CAPTURE else ''
+        if kind == 1:
+            text = (square_name(start)[0] + capture if capture else '') + square_name(end)
+            if flags & PROMOTION:
+                text += '=' + SAN_SYMBOLS[move_promotion(move)]
+        else:
+            others = [other & 63 for other in chessboard.legal_moves() if other != move and other >> 6 & 63 == end
+                      and abs(chessboard.board[other & 63]) == kind]
+            hint = ''
+            if others:
+                if all(other % 8 != start % 8 for other in others):
+                    hint = square_name(start)[0]
+                elif all(other // 8 != start // 8 for other in others):
+                    hint = square_name(start)[1]
+                else:
+                    hint = square_name(start)
+            text = SAN_SYMBOLS[kind] + hint + capture + square_name(end)
+    chessboard.make_move(move)
+    if chessboard.is_king_under_attack(chessboard.active_color):
+        text += '+' if chessboard.has_legal_move() else '#'
+    chessboard.unmake_move()
+    return text
+
+
+def replay_game(chessboard, game):
+    # Play the game on the board and yield (ply, zobrist key) for the start position and every move.
+    # Stops with ValueError at the first move that cannot be played.
+    chessboard.initialize_board_from_fen(game.headers.get('FEN', START_FEN))
+    yield 0, chessboard.zobrist_key
+    for ply, san in enumerate(game.moves, 1):
+        chessboard.make_move(parse_san(chessboard, san))
+        yield ply, chessboard.zobrist_key
+
+
+def _write_run(path, keys, offsets, plies):
+    # One sorted run as three .npy columns, memory-mapped again while merging
+    order = np.argsort(np.frombuffer(keys, dtype=np.uint64), kind='stable')
+    np.save(path + ".keys.npy", np.frombuffer(keys, dtype=np.uint64)[order])
+    np.save(path + ".offsets.npy", np.frombuffer(offsets, dtype=np.uint64)[order])
+    np.save(path + ".plies.npy", np.frombuffer(plies, dtype=np.uint16)[order])
+    return path
+
+
+def _iter_run(path, block=1 << 16):
+    keys, offsets, plies = (np.load(f"{path}.{column}.npy", mmap_mode='r') for column in ("keys", "offsets", "plies"))
+    for start in range(0, len(keys), block):
+        yield from zip(keys[start:start + block].tolist(), offsets[start:start + block].tolist(),
+                       plies[start:start + block].tolist())
+
+
+def build_index(pgn_path, index_path, run_records=1 << 22, progress=0, log=sys.stderr):
+    # Replay every game and write the sorted (key, game offset, ply) records to index_path. Records are
+    # sorted in runs of run_records that are merged at the end, so memory use does not grow with the archive.
+    start_time = time.perf_counter()
+    chessboard = Chessboard()
+    games = positions = errors = 0
+    keys, offsets, plies = array('Q'), array('Q'), array('H')
+    with tempfile.TemporaryDirectory() as directory:
+        runs = []
+        with open(pgn_path, 'rb') as stream:
+            for game in iter_games(stream):
+                games += 1
+                try:
+                    for ply, key in replay_game(chessboard, game):
+                        keys.append(key)
+                        offsets.append(game.offset)
+                        plies.append(ply)
+                except ValueError as error:
+                    errors += 1
+                    print(f"game at byte {game.offset}: {error}", file=log)
+                if len(keys) >= run_records:
+                    positions += len(keys)
+                    runs.append(_write_run(os.path.join(directory, f"run{len(runs)}"), keys, offsets, plies))
+                    keys, offsets, plies = array('Q'), array('Q'), array('H')
+                if progress and games % progress == 0:
+                    elapsed = time.perf_counter() - start_time
+                    print(f"{games} games  {positions + len(keys)} positions  {games / elapsed:.0f} games/s", file=log)
+        if keys:
+            positions += len(keys)
+            runs.append(_write_run(os.path.join(directory, f"run{len(runs)}"), keys, offsets, plies))
+        _merge_runs(runs, index_path, positions)
+    return IndexStats(games, positions, errors, time.perf_counter() - start_time)
+
+
+def _merge_runs(runs, index_path, count, block=1 << 16):
+    with open(index_path, 'wb') as index_file:
+        index_file.write(INDEX_MAGIC + count.to_bytes(8, 'little'))
+        index_file.truncate(INDEX_HEADER_BYTES + count * 18)
+    keys, offsets, plies = _index_columns(index_path, count, 'r+')
+    position = 0
+    buffer = []
+    for record in heapq.merge(*(_iter_run(run) for run in runs)):
+        buffer.append(record)
+        if len(buffer) == block:
+            position = _flush(buffer, keys, offsets, plies, position)
+    _flush(buffer, keys, offsets, plies, position)
+    for column in (keys, offsets, plies):
+        column.flush()
+
+
+def _flush(buffer, keys, offsets, plies, position):
+    if buffer:
+        block_keys, block_offsets, block_plies = zip(*buffer)
+        end = position + len(buffer)
+        keys[position:end] = block_keys
+        offsets[position:end] = block_offsets
+        plies[position:end] = block_plies
+        buffer.clear()
+        position = end
+    return position
+
+
+def _index_columns(index_path, count, mode='r'):
+    if count == 0:
+        return np.zeros(0, np.uint64), np.zeros(0, np.uint64), np.zeros(0, np.uint16)
+    keys = np.memmap(index_path, '<u8', mode, INDEX_HEADER_BYTES, (count,))
+    offsets = np.memmap(index_path, '<u8', mode, INDEX_HEADER_BYTES + count * 8, (count,))
+    plies = np.memmap(index_path, '<u2', mode, INDEX_HEADER_BYTES + count * 16, (count,))
+    return keys, offsets, plies
+
+
+class PositionIndex:
+    # Memory-mapped (zobrist key -> game offset, ply) index written by build_index
+    def __init__(self, index_path):
+        with open(index_path, 'rb') as index_file:
+            header = index_file.read(INDEX_HEADER_BYTES)
+        if header[:8] != INDEX_MAGIC:
+            raise ValueError(f"{index_path} is not a position index")
+        self.count = int.from_bytes(header[8:], 'little')
+        self.keys, self.offsets, self.plies = _index_columns(index_path, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, key):
+        # (game offset, ply) of every game that reached the position, in file order
+        key = np.uint64(key)
+        first = int(np.searchsorted(self.keys, key, 'left'))
+        last = int(np.searchsorted(self.keys, key, 'right'))
+        return list(zip(self.offsets[first:last].tolist(), self.plies[first:last].tolist()))
+
+    def games_reaching(self, chessboard):
+        return self.lookup(chessboard.zobrist_key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index PGN archives by position and search them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_parser = commands.add_parser("index", help="Replay every game and write the position index")
+    index_parser.add_argument("pgn")
+    index_parser.add_argument("index")
+    index_parser.add_argument("--run-records", type=int, default=1 << 22,
+                              help="Records sorted in memory at a time before they are merged")
+    index_parser.add_argument("--progress", type=int, default=10000, metavar="N")
+    search_parser = commands.add_parser("search", help="List the games that reached a position")
+    search_parser.add_argument("index")
+    search_parser.add_argument("--fen", default=START_FEN)
+    search_parser.add_argument("--pgn", help="PGN file the index was built from, to print the game headers")
+    search_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "index":
+        stats = build_index(args.pgn, args.index, args.run_records, args.progress)
+        print(f"{stats.games} games  {stats.positions} positions  {stats.errors} errors  {stats.elapsed:.2f}s  "
+              f"{stats.games / stats.elapsed:.0f} games/s")
+        return
+
+    index = PositionIndex(args.index)
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(args.fen)
+    start = time.perf_counter()
+    hits = index.games_reaching(chessboard)
+    seconds = time.perf_counter() - start
+    print(f"{len(hits)} games reached the position ({len(index)} positions indexed, {seconds * 1000:.2f} ms)")
+    stream = open(args.pgn, 'rb') if args.pgn else None
+    try:
+        for offset, ply in hits[:args.limit]:
+            if stream is None:
+                print(f"byte {offset}  ply {ply}")
+                continue
+            headers = read_game(stream, offset).headers
+            print(f"byte {offset}  ply {ply}  {headers.get('White', '?')} - {headers.get('Black', '?')}  "
+                  f"{headers.get('Date', '?')}  {headers.get('Result', '*')}")
+    finally:
+        if stream is not None:
+            stream.close()
+
+
+if __name__ == "__main__":
+    main()
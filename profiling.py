@@ -0,0 +1,122 @@
+import sys
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+import chess
+from chess import Chessboard
+
+# Chessboard methods the rules code spends its time in
+HOT_PATHS = ("legal_moves", "generate_pseudo_legal_moves", "checks_and_pins", "king_target_safe", "leaves_king_safe",
+             "has_legal_move", "make_move", "unmake_move", "is_king_under_attack", "is_square_attacked",
+             "game_status", "legal_targets", "get_valid_moves", "compute_zobrist_key")
+# Module-level rules helpers in chess. They are patched on the module, so only calls made through it are counted.
+HOT_FUNCTIONS = ("check_for_checkmate", "filter_safe_moves", "get_king_position")
+
+_NO_SECTION = nullcontext()
+
+
+class _Section:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    # Call counts and cumulative seconds of the hot-path methods and helpers and of named sections such as the
+    # parts of a GUI frame. The functions are only wrapped while the profiler is enabled, and a disabled profiler hands
+    # out a shared no-op section, so leaving the instrumentation in place costs next to nothing.
+    def __init__(self):
+        self.enabled = False
+        self.counts = {}
+        self.seconds = {}
+        self.frames = 0
+        self.originals = []
+        self.last_line = ({}, {}, 0)  # Totals when the last stats line was printed
+
+    def enable(self, cls=Chessboard, names=HOT_PATHS, module=chess, functions=HOT_FUNCTIONS):
+        if not self.enabled:
+            for owner, owner_names in ((cls, names), (module, functions)):
+                for name in owner_names:
+                    function = vars(owner).get(name)
+                    if function is not None:
+                        self.originals.append((owner, name, function))
+                        setattr(owner, name, self._timed(name, function))
+            self.enabled = True
+        return self
+
+    def disable(self):
+        for owner, name, function in reversed(self.originals):
+            setattr(owner, name, function)
+        self.originals = []
+        self.enabled = False
+
+    def reset(self):
+        self.counts.clear()
+        self.seconds.clear()
+        self.frames = 0
+        self.last_line = ({}, {}, 0)
+
+    def _timed(self, name, function):
+        record = self.record
+        clock = time.perf_counter
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, clock() - start)
+        return timed
+
+    def record(self, name, seconds):
+        self.counts[name] = self.counts.get(name, 0) + 1
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def section(self, name):
+        # with profiler.section("draw"): ... times the block when enabled
+        return _Section(self, name) if self.enabled else _NO_SECTION
+
+    def end_frame(self):
+        if self.enabled:
+            self.frames += 1
+
+    def report(self, file=sys.stdout):
+        # Every method, helper and section by cumulative time; time includes the profiled calls made inside it
+        frames = self.frames
+        header = f"{'name':28} {'calls':>10} {'total ms':>10} {'us/call':>9}"
+        print(header + (f" {'calls/frame':>12}" if frames else ""), file=file)
+        for name in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            calls, seconds = self.counts[name], self.seconds[name]
+            line = f"{name:28} {calls:10} {seconds * 1000:10.1f} {seconds / calls * 1e6:9.1f}"
+            if frames:
+                line += f" {calls / frames:12.1f}"
+            print(line, file=file)
+        if frames:
+            print(f"{frames} frames", file=file)
+
+    def stats_line(self):
+        # Averages per frame since the previous stats line, sections first then the busiest methods
+        counts, seconds, frames = self.last_line
+        hot = HOT_PATHS + HOT_FUNCTIONS
+        new_frames = max(self.frames - frames, 1)
+        deltas = {name: total - seconds.get(name, 0.0) for name, total in self.seconds.items()}
+        busiest = sorted(deltas, key=deltas.get, reverse=True)
+        parts = [f"{self.frames - frames} frames"]
+        parts += [f"{name} {deltas[name] * 1000 / new_frames:.2f} ms" for name in busiest if name not in hot]
+        parts += [f"{name} {(self.counts[name] - counts.get(name, 0)) / new_frames:.1f}/frame"
+                  for name in busiest if name in hot][:5]
+        self.last_line = (dict(self.counts), dict(self.seconds), self.frames)
+        return "  ".join(parts)
+
+
+# The profiler the GUI and command line tools share
+PROFILER = Profiler()
@@ -0,0 +1,336 @@
+import argparse
+import time
+from collections import namedtuple
+
+from chess import CAPTURE, PROMOTION, Chessboard, move_promotion, move_to_uci
+from tablebase import WIN as TABLEBASE_WIN
+from transposition import TranspositionTable
+
+MATE_SCORE = 100000
+MATE_THRESHOLD = MATE_SCORE - 1000  # Scores beyond this are mates, stored relative to the node in the table
+INFINITY = MATE_SCORE + 1
+MAX_PLY = 128
+
+# Material in centipawns for move ordering
+PIECE_VALUES = {1: 100, 2: 320, 3: 330, 4: 500, 5: 900, 6: 0}
+
+# Transposition table bound types
+EXACT, LOWER, UPPER = 0, 1, 2
+
+SearchResult = namedtuple("SearchResult", "best_move score depth pv nodes elapsed")
+
+
+class SearchAborted(Exception):
+    pass
+
+
+def evaluate(chessboard):
+    # Tapered material and piece-square score from the point of view of the side to move, kept up to date
+    # by make_move so this is a constant time read
+    return chessboard.evaluate()
+
+
+def score_to_table(score, ply):
+    # Mate scores are stored as distance from the stored node rather than from the root
+    if score > MATE_THRESHOLD:
+        return score + ply
+    if score < -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_tablebase(value, ply):
+    # Tablebase value (plies to mate from the probed node) as a mate score relative to the root
+    if value > 0:
+        return MATE_SCORE - ply - (TABLEBASE_WIN - value)
+    if value < 0:
+        return -MATE_SCORE + ply + (TABLEBASE_WIN + value)
+    return 0
+
+
+def score_from_table(score, ply):
+    if score > MATE_THRESHOLD:
+        return score - ply
+    if score < -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+class Searcher:
+    def __init__(self, chessboard, table=None, book=None, tablebases=None):
+        self.chessboard = chessboard
+        self.table = table if table is not None else TranspositionTable()
+        self.book = book  # OpeningBook; a book move is played without searching
+        self.tablebases = tablebases  # Tablebases; covered endgames are scored exactly instead of searched
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {}
+        self.nodes = 0
+        self.stop = False  # May be set from another thread to end the search early
+        self.deadline = None
+        self.time_limit = None
+        # Set before a ponder search starts, cleared from another thread on ponderhit; the clock starts then
+        self.pondering = False
+        self.node_limit = None
+        self.pv_table = [[] for _ in range(MAX_PLY + 1)]
+
+    def search(self, max_depth=MAX_PLY, time_limit=None, node_limit=None, info=None):
+        # Iterative deepening until max_depth, the time limit (seconds) or the node limit is reached.
+        # info is called with a SearchResult after every completed iteration.
+        start = time.perf_counter()
+        if self.book is not None:
+            move = self.book.choose_move(self.chessboard)
+            if move is not None:
+                return SearchResult(move, 0, 0, [move], 0, time.perf_counter() - start)
+        self.time_limit = time_limit
+        self.deadline = start + time_limit if time_limit is not None and not self.pondering else None
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.stop = False
+        self.table.new_search()
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+
+        result = SearchResult(None, 0, 0, [], 0, 0.0)
+        for depth in range(1, max_depth + 1):
+            try:
+                score = self.negamax(depth, -INFINITY, INFINITY, 0)
+            except SearchAborted:
+                break
+            pv = self.complete_pv(list(self.pv_table[0]), depth)
+            result = SearchResult(pv[0] if pv else None, score, depth, pv, self.nodes, time.perf_counter() - start)
+            if info is not None:
+                info(result)
+            if abs(score) > MATE_THRESHOLD and MATE_SCORE - abs(score) <= depth:
+                break  # Found a forced mate within the searched depth
+
+        if result.best_move is None:
+            # Not even depth 1 finished, fall back to any legal move
+            moves = self.chessboard.legal_moves()
+            if moves:
+                result = result._replace(best_move=moves[0], pv=[moves[0]])
+        return result._replace(nodes=self.nodes, elapsed=time.perf_counter() - start)
+
+    def complete_pv(self, pv, depth):
+        # A table cutoff inside the principal variation leaves it cut short there; follow the best moves
+        # stored in the table from its end, as long as they are legal and no position repeats
+        chessboard = self.chessboard
+        played = 0
+        seen = {chessboard.zobrist_key}
+        for move in pv:
+            chessboard.make_move(move)
+            played += 1
+            seen.add(chessboard.zobrist_key)
+        while len(pv) < depth:
+            entry = self.table.probe(chessboard.zobrist_key)
+            move = entry[3] if entry is not None else None
+            if move is None or move not in chessboard.legal_moves():
+                break
+            chessboard.make_move(move)
+            played += 1
+            if chessboard.zobrist_key in seen:
+                break
+            seen.add(chessboard.zobrist_key)
+            pv.append(move)
+        for _ in range(played):
+            chessboard.unmake_move()
+        return pv
+
+    def check_limits(self):
+        if self.deadline is None and self.time_limit is not None and not self.pondering:
+            self.deadline = time.perf_counter() + self.time_limit  # The pondered move was played
+        if self.stop or (self.node_limit is not None and self.nodes >= self.node_limit) or \
+                (self.deadline is not None and time.perf_counter() >= self.deadline):
+            raise SearchAborted
+
+    def is_repetition(self):
+        # Any earlier position since the last capture or pawn move with the same key
+        chessboard = self.chessboard
+        key = chessboard.zobrist_key
+        reversible = chessboard.halfmove_clock if chessboard.halfmove_clock is not None else len(chessboard.move_stack)
+        for record in chessboard.move_stack[-1:-reversible - 1:-1]:
+            if record.zobrist_key == key:
+                return True
+        return False
+
+    def order_moves(self, moves, table_move, ply):
+        board = self.chessboard.board
+        killers = self.killers[ply]
+
+        def move_score(move):
+            if move == table_move:
+                return 1000000
+            flags = move >> 12
+            if flags & CAPTURE:
+                # MVV-LVA: most valuable victim first, least valuable attacker breaks ties. En passant has
+                # no piece on the end square and counts as taking a pawn.
+                victim = abs(board[move >> 6 & 63]) or 1
+                return 100000 + PIECE_VALUES[victim] * 10 - abs(board[move & 63])
+            if flags & PROMOTION:
+                return 90000 + PIECE_VALUES[move_promotion(move)]
+            if move == killers[0]:
+                return 80000
+            if move == killers[1]:
+                return 70000
+            return self.history.get(move & 0xFFF, 0)
+
+        return sorted(moves, key=move_score, reverse=True)
+
+    def negamax(self, depth, alpha, beta, ply):
+        chessboard = self.chessboard
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_limits()
+        self.pv_table[ply] = []
+
+        if ply > 0:
+            if self.is_repetition():
+                return 0
+            if chessboard.halfmove_clock is not None and chessboard.halfmove_clock >= 100:
+                # A mate on the hundredth ply still stands, the fifty-move rule only draws if a move is left
+                if chessboard.is_king_under_attack(chessboard.active_color) and not chessboard.has_legal_move():
+                    return -MATE_SCORE + ply
+                return 0
+            if self.tablebases is not None:
+                value = self.tablebases.probe(chessboard)
+                if value is not None:
+                    return score_from_tablebase(value, ply)
+        if ply >= MAX_PLY - 1:
+            return evaluate(chessboard)
+
+        in_check = chessboard.is_king_under_attack(chessboard.active_color)
+        if in_check:
+            depth += 1  # Check extension
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+
+        original_alpha = alpha
+        table_move = None
+        entry = self.table.probe(chessboard.zobrist_key)
+        if entry is not None:
+            entry_depth, flag, entry_score, table_move = entry
+            if ply > 0 and entry_depth >= depth:
+                entry_score = score_from_table(entry_score, ply)
+                if flag == EXACT or (flag == LOWER and entry_score >= beta) or \
+                        (flag == UPPER and entry_score <= alpha):
+                    return entry_score
+
+        moves = chessboard.legal_moves(moves=chessboard.move_buffer(ply))
+        if not moves:
+            return -MATE_SCORE + ply if in_check else 0
+
+        best_score = -INFINITY
+        best_move = None
+        for move in self.order_moves(moves, table_move, ply):
+            is_quiet = not move >> 12 & (CAPTURE | PROMOTION)
+            chessboard.make_move(move)
+            try:
+                score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                chessboard.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+                    if alpha >= beta:
+                        if is_quiet:
+                            killers = self.killers[ply]
+                            if move != killers[0]:
+                                killers[1] = killers[0]
+                                killers[0] = move
+                            # History is kept per start and end square, the low 12 bits of the move
+                            self.history[move & 0xFFF] = self.history.get(move & 0xFFF, 0) + depth * depth
+                        break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(chessboard.zobrist_key, (depth, flag, score_to_table(best_score, ply), best_move), depth)
+        return best_score
+
+    def quiescence(self, alpha, beta, ply):
+        # Only captures and promotions are searched until the position is quiet
+        chessboard = self.chessboard
+        self.nodes += 1
+        if self.nodes & 1023 == 0:
+            self.check_limits()
+        self.pv_table[ply] = []
+
+        stand_pat = evaluate(chessboard)
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        moves = chessboard.legal_moves(captures_only=True, moves=chessboard.move_buffer(ply))
+        for move in self.order_moves(moves, None, ply):
+            chessboard.make_move(move)
+            try:
+                score = -self.quiescence(-beta, -alpha, ply + 1)
+            finally:
+                chessboard.unmake_move()
+            if score > alpha:
+                alpha = score
+                self.pv_table[ply] = [move] + self.pv_table[ply + 1]
+                if alpha >= beta:
+                    break
+        return alpha
+
+
+def format_score(score):
+    if score > MATE_THRESHOLD:
+        return f"mate {(MATE_SCORE - score + 1) // 2}"
+    if score < -MATE_THRESHOLD:
+        return f"mate -{(MATE_SCORE + score) // 2}"
+    return f"cp {score}"
+
+
+def run_bench(positions, max_depth, time_limit, hash_mb, book=None, tablebases=None):
+    # Search every position and report the depth reached and the time each iteration took
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen in positions:
+        chessboard = Chessboard()
+        chessboard.initialize_board_from_fen(fen)
+        searcher = Searcher(chessboard, TranspositionTable(hash_mb), book, tablebases)
+        iteration_times = []
+        result = searcher.search(max_depth, time_limit,
+                                 info=lambda iteration: iteration_times.append(iteration.elapsed))
+        total_nodes += result.nodes
+        total_time += result.elapsed
+        per_depth = " ".join(f"{seconds:.2f}" for seconds in iteration_times)
+        if result.depth == 0 and result.nodes == 0:
+            print(f"{name:10} book move {move_to_uci(result.best_move)}")
+            continue
+        print(f"{name:10} depth {result.depth:2}  {result.nodes:>8} nodes  {result.elapsed:6.2f}s  "
+              f"{result.nodes / result.elapsed:>7.0f} nps  {result.depth / result.elapsed:5.2f} depth/s  "
+              f"{format_score(result.score):10} {' '.join(move_to_uci(move) for move in result.pv)}")
+        print(f"{'':10} time per depth: {per_depth}")
+    print(f"{'total':10}           {total_nodes:>8} nodes  {total_time:6.2f}s  {total_nodes / total_time:>7.0f} nps")
+
+
+def main():
+    from book import OpeningBook
+    from perft import POSITIONS
+    from tablebase import Tablebases
+
+    parser = argparse.ArgumentParser(description="Alpha-beta search over Chessboard")
+    parser.add_argument("--fen", help="Search a single position instead of the perft positions")
+    parser.add_argument("--depth", type=int, default=MAX_PLY)
+    parser.add_argument("--movetime", type=float, default=5.0, help="Seconds per position")
+    parser.add_argument("--hash", type=int, default=16, metavar="MB")
+    parser.add_argument("--book", help="Opening book built by book.py")
+    parser.add_argument("--tablebases", metavar="DIRECTORY", help="Endgame tables built by tablebase.py")
+    args = parser.parse_args()
+
+    positions = [("fen", args.fen)] if args.fen else [(name, fen) for name, fen, _ in POSITIONS]
+    run_bench(positions, args.depth, args.movetime, args.hash, OpeningBook(args.book) if args.book else None,
+              Tablebases(args.tablebases) if args.tablebases else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from chess import KING_TARGETS, PAWN_CAPTURES, PIECE_SYMBOLS, QUEEN_RAYS, ROOK_RAYS, Chessboard, move_to_uci
+
+# Distance-to-mate tables for king and one white piece against a lone king. One int16 per position,
+# index = side to move * 262144 + white king * 4096 + black king * 64 + piece square, the value from the
+# side to move's point of view: WIN - plies to mate for a win, -(WIN - plies) for a loss, 0 for a draw or an
+# illegal position. Positions with the extra piece on black's side are probed color-flipped.
+TABLES = {'kqk': 5, 'krk': 4, 'kpk': 1}
+TABLE_DEPENDENCIES = {'kpk': ('kqk', 'krk')}  # Promotions are looked up in the finished smaller tables
+WIN = 1000
+SIDE_SIZE = 64 * 64 * 64
+TABLE_SIZE = 2 * SIDE_SIZE
+
+# Node types of the successor graph, per position
+ILLEGAL, LEGAL, IN_CHECK = 0, 1, 2
+
+KING_NEIGHBORS = tuple(frozenset(targets) for targets in KING_TARGETS)
+
+
+def table_index(white_to_move, white_king, black_king, square):
+    return (0 if white_to_move else SIDE_SIZE) + white_king * 4096 + black_king * 64 + square
+
+
+def _piece_attacks(piece, square, blockers):
+    # Squares attacked by the white piece, sliders stop at (and include) the first blocker
+    if piece == 1:
+        return set(PAWN_CAPTURES[1][square])
+    attacked = set()
+    for ray in (QUEEN_RAYS if piece == 5 else ROOK_RAYS)[square]:
+        for target in ray:
+            attacked.add(target)
+            if target in blockers:
+                break
+    return attacked
+
+
+def _successor_block(task):
+    # Node types, child counts and child indices of the 4096 positions with one side to move and one
+    # white king square. Captures of the piece go to draw_node; promotions to promotion_bases[piece] plus
+    # the index in that table, or draw_node for bishops and knights.
+    piece, white_to_move, white_king, draw_node, promotion_bases = task
+    node_types = array('b')
+    counts = array('B')
+    children = array('q')
+    for black_king in range(64):
+        for square in range(64):
+            child_count = len(children)
+            node_type = ILLEGAL
+            if (black_king != white_king and square != white_king and square != black_king
+                    and black_king not in KING_NEIGHBORS[white_king] and not (piece == 1 and square // 8 in (0, 7))):
+                if white_to_move:
+                    if black_king not in _piece_attacks(piece, square, (white_king,)):
+                        node_type = LEGAL
+                        _white_moves(piece, white_king, black_king, square, draw_node, promotion_bases, children)
+                else:
+                    attacked = _piece_attacks(piece, square, (white_king,))  # The black king does not block
+                    node_type = IN_CHECK if black_king in attacked else LEGAL
+                    attacked |= KING_NEIGHBORS[white_king]
+                    for target in KING_TARGETS[black_king]:
+                        if target in attacked or target == white_king:
+                            continue
+                        if target == square:
+                            children.append(draw_node)  # Only the two kings are left
+                        else:
+                            children.append(table_index(True, white_king, target, square))
+            node_types.append(node_type)
+            counts.append(len(children) - child_count)
+    return node_types, counts, children
+
+
+def _white_moves(piece, white_king, black_king, square, draw_node, promotion_bases, children):
+    for target in KING_TARGETS[white_king]:
+        if target != square and target != black_king and target not in KING_NEIGHBORS[black_king]:
+            children.append(table_index(False, target, black_king, square))
+    if piece == 1:
+        pushes = [square - 8]
+        if square // 8 == 6:
+            pushes.append(square - 16)
+        for target in pushes:
+            if target == white_king or target == black_king:
+                break
+            if target < 8:
+                for promotion in (5, 4, 3, 2):
+                    if promotion in promotion_bases:
+                        children.append(promotion_bases[promotion] + table_index(False, white_king, black_king, target))
+                    else:
+                        children.append(draw_node)
+            else:
+                children.append(table_index(False, white_king, black_king, target))
+        return
+    for ray in (QUEEN_RAYS if piece == 5 else ROOK_RAYS)[square]:
+        for target in ray:
+            if target == white_king or target == black_king:
+                break
+            children.append(table_index(False, white_king, black_king, target))
+
+
+def build_successors(piece, draw_node, promotion_bases, workers=None):
+    # CSR successor graph of the whole table, built in parallel per side to move and white king square
+    tasks = [(piece, white_to_move, white_king, draw_node, promotion_bases)
+             for white_to_move in (True, False) for white_king in range(64)]
+    node_types, counts, children = [], [], []
+    with ProcessPoolExecutor(workers) as executor:
+        for block_types, block_counts, block_children in executor.map(_successor_block, tasks):
+            node_types.append(np.frombuffer(block_types, dtype=np.int8))
+            counts.append(np.frombuffer(block_counts, dtype=np.uint8))
+            children.append(np.frombuffer(block_children, dtype=np.int64))
+    return np.concatenate(node_types), np.concatenate(counts).astype(np.int64), np.concatenate(children)
+
+
+def solve(node_types, counts, children, external_values):
+    # Retrograde analysis level by level: a position is won in n plies if some move reaches a position lost
+    # in n - 1, and lost in n plies once every move reaches a won position, the slowest in n - 1.
+    # Children beyond the table index external_values, whose values are final from the start.
+    values = np.zeros(TABLE_SIZE + len(external_values), dtype=np.int32)
+    values[TABLE_SIZE:] = external_values
+    resolved = np.zeros(len(values), dtype=bool)
+    resolved[TABLE_SIZE:] = True
+    resolved[:TABLE_SIZE] = (node_types == ILLEGAL) | (counts == 0)  # Illegal, mate or stalemate
+    mated = (node_types == IN_CHECK) & (counts == 0)
+    values[:TABLE_SIZE][mated] = -WIN
+
+    has_children = np.flatnonzero(counts)
+    starts = (np.cumsum(counts) - counts)[has_children]
+    external_losses = external_values[external_values < 0]
+    last_level = WIN + int(external_losses.max()) + 1 if len(external_losses) else 0  # Slowest external loss + 1
+    plies = 0
+    while True:
+        plies += 1
+        child_values = values[children]
+        child_resolved = resolved[children]
+        reaches_loss = np.logical_or.reduceat(child_resolved & (child_values == -(WIN - plies + 1)), starts)
+        all_won = np.logical_and.reduceat(child_resolved & (child_values > 0), starts)
+        open_nodes = ~resolved[has_children]
+        wins = has_children[open_nodes & reaches_loss]
+        losses = has_children[open_nodes & all_won & ~reaches_loss]
+        values[wins] = WIN - plies
+        values[losses] = -(WIN - plies)
+        resolved[wins] = True
+        resolved[losses] = True
+        if not len(wins) and not len(losses) and plies >= last_level:
+            break
+    return values[:TABLE_SIZE].astype(np.int16)
+
+
+def build_table(name, directory, workers=None):
+    piece = TABLES[name]
+    external = [np.zeros(1, dtype=np.int16)]  # The draw node
+    promotion_bases = {}
+    for dependency in TABLE_DEPENDENCIES.get(name, ()):
+        promotion_bases[TABLES[dependency]] = TABLE_SIZE + sum(len(values) for values in external)
+        external.append(np.load(os.path.join(directory, f"{dependency}.npy"), mmap_mode='r'))
+    node_types, counts, children = build_successors(piece, TABLE_SIZE, promotion_bases, workers)
+    values = solve(node_types, counts, children, np.concatenate(external).astype(np.int32))
+    np.save(os.path.join(directory, f"{name}.npy"), values)
+    return values
+
+
+def build_tables(names, directory, workers=None, force=False, log=sys.stdout):
+    # Build the tables and the tables they depend on, keeping the ones that already exist unless force is set
+    os.makedirs(directory, exist_ok=True)
+    order = []
+    for name in names:
+        for dependency in TABLE_DEPENDENCIES.get(name, ()) + (name,):
+            if dependency not in order:
+                order.append(dependency)
+    for name in order:
+        path = os.path.join(directory, f"{name}.npy")
+        if os.path.exists(path) and not force:
+            print(f"{name}  exists, skipped", file=log)
+            continue
+        start = time.perf_counter()
+        values = build_table(name, directory, workers)
+        longest = WIN - int(np.abs(values[values != 0]).min()) if values.any() else 0
+        print(f"{name}  {np.count_nonzero(values > 0)} wins  {np.count_nonzero(values < 0)} losses  "
+              f"longest mate {longest} plies  {time.perf_counter() - start:.1f}s", file=log)
+
+
+class Tablebases:
+    # Memory-mapped probes of the tables found in a directory; also knows that KBK and KNK are draws
+    def __init__(self, directory):
+        self.tables = {}
+        for name, piece in TABLES.items():
+            path = os.path.join(directory, f"{name}.npy")
+            if os.path.exists(path):
+                self.tables[piece] = np.load(path, mmap_mode='r')
+
+    def probe(self, chessboard):
+        # Value from the side to move's point of view, None if the material is not covered
+        board = chessboard.board
+        squares = np.flatnonzero(board)
+        if len(squares) == 2:
+            return 0
+        if len(squares) != 3:
+            return None
+        white_king = black_king = square = None
+        extra = 0
+        for piece_square in squares.tolist():
+            piece = board[piece_square]
+            if piece == 6:
+                white_king = piece_square
+            elif piece == -6:
+                black_king = piece_square
+            else:
+                extra = piece
+                square = piece_square
+        if abs(extra) in (2, 3):
+            return 0
+        table = self.tables.get(abs(extra))
+        if table is None or white_king is None or black_king is None:
+            return None
+        white_to_move = chessboard.active_color == 'w'
+        if extra < 0:
+            # Swap the colors: mirror the board vertically and give the piece to white
+            white_king, black_king, square = black_king ^ 56, white_king ^ 56, square ^ 56
+            white_to_move = not white_to_move
+        return int(table[table_index(white_to_move, white_king, black_king, square)])
+
+    def probe_after(self, chessboard, move):
+        chessboard.make_move(move)
+        value = self.probe(chessboard)
+        chessboard.unmake_move()
+        return value
+
+    def best_move(self, chessboard):
+        # (move, value) of the move that wins fastest, draws, or loses slowest; None if not covered
+        if self.probe(chessboard) is None:
+            return None
+        best = None
+        for move in chessboard.legal_moves():
+            value = self.probe_after(chessboard, move)
+            if value is not None and (best is None or value < best[1]):
+                best = (move, value)
+        return best
+
+
+def plies_to_mate(value):
+    return WIN - abs(value) if value else None
+
+
+def backed_up(value):
+    # A successor's value seen from the position before it, one ply further from the mate
+    if value == 0:
+        return 0
+    return -value + 1 if value > 0 else -value - 1
+
+
+def search_value(chessboard, depth):
+    # The table value worked out by brute force from the rules alone: exact if the game ends within depth
+    # plies with best play, None if it may last longer
+    moves = chessboard.legal_moves()
+    if not moves:
+        return -WIN if chessboard.is_king_under_attack(chessboard.active_color) else 0
+    pieces = np.abs(chessboard.board[np.flatnonzero(chessboard.board)])
+    if len(pieces) == 2 or (len(pieces) == 3 and np.isin(pieces, (2, 3)).any()):
+        return 0
+    if depth == 0:
+        return None
+    best = None
+    unresolved = False
+    for move in moves:
+        chessboard.make_move(move)
+        value = search_value(chessboard, depth - 1)
+        chessboard.unmake_move()
+        if value is None:
+            unresolved = True
+        elif best is None or backed_up(value) > best:
+            best = backed_up(value)
+    if best is not None and best > 0:
+        return best  # A mate within depth plies is faster than anything left unresolved
+    return None if unresolved else best
+
+
+def random_position(piece, rng):
+    # FEN of a random legal position with the two kings and piece (negative for black)
+    while True:
+        white_king, black_king = rng.sample(range(64), 2)
+        square = rng.randrange(8, 56) if abs(piece) == 1 else rng.randrange(64)
+        if black_king in KING_NEIGHBORS[white_king] or square in (white_king, black_king):
+            continue
+        cells = ['1'] * 64
+        cells[white_king], cells[black_king], cells[square] = 'K', 'k', PIECE_SYMBOLS[piece]
+        placement = '/'.join(''.join(cells[row * 8:row * 8 + 8]) for row in range(8))
+        color = rng.choice('wb')
+        chessboard = Chessboard()
+        chessboard.initialize_board_from_fen(f"{placement} {color} - - 0 1")
+        if not chessboard.is_king_under_attack('b' if color == 'w' else 'w'):
+            return chessboard.get_fen()
+
+
+def check_position(tablebases, chessboard, depth):
+    # Error messages for a stored value that disagrees with its successors or with a brute force search
+    value = tablebases.probe(chessboard)
+    errors = []
+    moves = chessboard.legal_moves()
+    if moves:
+        expected = max(backed_up(tablebases.probe_after(chessboard, move)) for move in moves)
+    else:
+        expected = -WIN if chessboard.is_king_under_attack(chessboard.active_color) else 0
+    if value != expected:
+        errors.append(f"stored {value}, the successors give {expected}")
+    searched = search_value(chessboard, depth)
+    if searched is not None and searched != value:
+        errors.append(f"stored {value}, a {depth} ply search finds {searched}")
+    elif searched is None and value != 0 and plies_to_mate(value) <= depth:
+        errors.append(f"stored {value}, a {depth} ply search finds no mate")
+    return errors, searched is not None
+
+
+def check_tables(tablebases, names, samples, depth, seed, log=sys.stdout):
+    # Random positions of every table, plus the last plies of each won line where the mate is within reach
+    # of the search. Returns False if any value was wrong.
+    rng = random.Random(seed)
+    passed = True
+    for name in names:
+        start = time.perf_counter()
+        fens = []
+        for _ in range(samples):
+            fens.append(random_position(TABLES[name] * rng.choice((1, -1)), rng))
+            chessboard = Chessboard()
+            chessboard.initialize_board_from_fen(fens[-1])
+            value = tablebases.probe(chessboard)
+            while value and plies_to_mate(value) > depth and len(chessboard.move_stack) < 200:
+                move, value = tablebases.best_move(chessboard)
+                chessboard.make_move(move)
+            if value and chessboard.move_stack:
+                fens.append(chessboard.get_fen())
+        failures = []
+        searched = 0
+        for fen in fens:
+            chessboard = Chessboard()
+            chessboard.initialize_board_from_fen(fen)
+            errors, resolved = check_position(tablebases, chessboard, depth)
+            searched += resolved
+            failures += [f"{fen}: {error}" for error in errors]
+        status = "ok" if not failures else f"FAIL ({len(failures)} wrong values)"
+        print(f"{name}  {len(fens):5} positions  {searched:5} settled by a {depth} ply search  "
+              f"{time.perf_counter() - start:7.2f}s  {status}", file=log)
+        for message in failures[:5]:
+            print(f"  {message}", file=log)
+        passed = passed and not failures
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate and probe endgame tablebases")
+    parser.add_argument("--directory", default="tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Generate tables by retrograde analysis")
+    build_parser.add_argument("tables", nargs="*", help=f"Tables to build out of {', '.join(TABLES)} (default: all)")
+    build_parser.add_argument("--workers", type=int, help="Processes for the successor graph")
+    build_parser.add_argument("--force", action="store_true", help="Rebuild tables that already exist")
+    probe_parser = commands.add_parser("probe", help="Probe a position and play out the best line")
+    probe_parser.add_argument("fen")
+    check_parser = commands.add_parser("check", help="Spot check built tables against their successors and "
+                                                     "a brute force search")
+    check_parser.add_argument("tables", nargs="*", help="Tables to check (default: all built ones)")
+    check_parser.add_argument("--samples", type=int, default=30, help="Random positions per table")
+    check_parser.add_argument("--depth", type=int, default=3, help="Plies of the brute force search")
+    check_parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        unknown = sorted(set(args.tables) - set(TABLES))
+        if unknown:
+            parser.error(f"unknown tables: {', '.join(unknown)}")
+        build_tables(args.tables or list(TABLES), args.directory, args.workers, args.force)
+        return
+
+    tablebases = Tablebases(args.directory)
+    if args.command == "check":
+        built = [name for name, piece in TABLES.items() if piece in tablebases.tables]
+        names = args.tables or built
+        if not names:
+            parser.error(f"no tables built in {args.directory}")
+        missing = sorted({table for name in names for table in (name, *TABLE_DEPENDENCIES.get(name, ()))}
+                         - set(built))
+        if missing:
+            parser.error(f"tables not built in {args.directory}: {', '.join(missing)}")
+        if not check_tables(tablebases, names, args.samples, args.depth, args.seed):
+            sys.exit(1)
+        return
+    chessboard = Chessboard()
+    chessboard.initialize_board_from_fen(args.fen)
+    value = tablebases.probe(chessboard)
+    if value is None:
+        print("not in the tablebases")
+        return
+    result = "draw" if value == 0 else f"{'win' if value > 0 else 'loss'} in {plies_to_mate(value)} plies"
+    line = []
+    while value != 0 and len(line) < 200:
+        best = tablebases.best_move(chessboard)
+        if best is None:
+            break
+        line.append(move_to_uci(best[0]))
+        chessboard.make_move(best[0])
+        if tablebases.probe(chessboard) == 0 and value != 0:
+            break  # Only the kings are left, or the line drifted into a draw
+    print(f"{result}  {' '.join(line)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Rough CPython cost of one slot: the key int, the entry tuple and the two list pointers
+ENTRY_BYTES = 128
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        # Round the slot count down to a power of two so the slot is a cheap mask of the key
+        entries = max(1, size_mb * 1024 * 1024 // ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = [None] * self.size
+        self.entries = [None] * self.size  # (depth, generation, value)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.overwrites = 0  # Stores that evicted a different position
+
+    def probe(self, key):
+        slot = key & self.mask
+        if self.keys[slot] == key:
+            self.hits += 1
+            return self.entries[slot][2]
+        self.misses += 1
+        return None
+
+    def store(self, key, value, depth=0):
+        # Replace an entry of another position only if it comes from an older search or a shallower depth
+        slot = key & self.mask
+        stored_key = self.keys[slot]
+        if stored_key is not None and stored_key != key:
+            stored_depth, stored_generation, _ = self.entries[slot]
+            if stored_generation == self.generation and stored_depth > depth:
+                return False
+            self.overwrites += 1
+        self.keys[slot] = key
+        self.entries[slot] = (depth, self.generation, value)
+        self.stores += 1
+        return True
+
+    def new_search(self):
+        # Entries from earlier searches become replaceable regardless of their depth
+        self.generation += 1
+
+    def clear(self):
+        self.keys = [None] * self.size
+        self.entries = [None] * self.size
+        self.generation = 0
+        self.hits = self.misses = self.stores = self.overwrites = 0
+
+    def hashfull(self):
+        # Permille of the first thousand slots that are in use, as reported by UCI engines
+        sample = min(1000, self.size)
+        return sum(1 for key in self.keys[:sample] if key is not None) * 1000 // sample
+
+    def hit_rate(self):
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def stats(self):
+        return (f"tt size={self.size} hits={self.hits} misses={self.misses} hit_rate={self.hit_rate():.1%} "
+                f"stores={self.stores} overwrites={self.overwrites} hashfull={self.hashfull()}")
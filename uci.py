@@ -0,0 +1,198 @@
+import sys
+import threading
+
+from book import OpeningBook
+from chess import START_FEN, Chessboard, move_from_uci, move_to_uci
+from search import MAX_PLY, Searcher, format_score
+from tablebase import Tablebases
+from transposition import TranspositionTable
+
+ENGINE_NAME = "chess"
+ENGINE_AUTHOR = "hcm444"
+
+# name -> (UCI option declaration, default value)
+OPTIONS = {
+    "Hash": ("type spin default 16 min 1 max 4096", 16),
+    "BookFile": ("type string default <empty>", ""),
+    "TablebasePath": ("type string default <empty>", ""),
+    "Ponder": ("type check default false", False),
+}
+
+
+class UciEngine:
+    # UCI protocol over a Chessboard. Commands are read on the calling thread; go starts the search on a
+    # worker thread so stop, ponderhit and isready are answered while it runs.
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.chessboard = Chessboard()
+        self.chessboard.initialize_board_from_fen(START_FEN)
+        self.table = TranspositionTable(OPTIONS["Hash"][1])
+        self.book = None
+        self.tablebases = None
+        self.searcher = None
+        self.worker = None
+        self.waiting = False  # Infinite or ponder search: hold bestmove back until stop or ponderhit
+        self.finished = threading.Event()  # Set when stop or ponderhit releases a held bestmove
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self, lines=sys.stdin):
+        for line in lines:
+            if not self.handle(line.strip()):
+                break
+        self.stop()
+
+    def handle(self, line):
+        # Returns False on quit. A malformed command is answered with an info string instead of ending the engine.
+        tokens = line.split()
+        if not tokens:
+            return True
+        try:
+            return self.dispatch(tokens[0], tokens[1:])
+        except (ValueError, TypeError, IndexError, OSError) as error:
+            self.send(f"info string error in {line!r}: {error}")
+            return True
+
+    def dispatch(self, command, arguments):
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            for name, (declaration, _) in OPTIONS.items():
+                self.send(f"option name {name} {declaration}")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(arguments)
+        elif command == "ucinewgame":
+            self.stop()
+            self.table.clear()
+        elif command == "position":
+            self.stop()
+            self.set_position(arguments)
+        elif command == "go":
+            self.stop()
+            self.go(arguments)
+        elif command == "stop":
+            self.stop()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            return False
+        return True
+
+    def set_option(self, arguments):
+        # setoption name <name> [value <value>], both may contain spaces
+        text = " ".join(arguments)
+        name, _, value = text.partition(" value ")
+        name = name.removeprefix("name").strip()
+        value = value.strip()
+        if name == "Hash":
+            self.table = TranspositionTable(max(1, int(value)))
+        elif name == "BookFile":
+            self.book = OpeningBook(value) if value and value != "<empty>" else None
+        elif name == "TablebasePath":
+            self.tablebases = Tablebases(value) if value and value != "<empty>" else None
+
+    def set_position(self, arguments):
+        # position [startpos | fen <six fields>] [moves <uci moves>]
+        if "moves" in arguments:
+            split = arguments.index("moves")
+            arguments, moves = arguments[:split], arguments[split + 1:]
+        else:
+            moves = []
+        fen = " ".join(arguments[1:]) if arguments[:1] == ["fen"] else START_FEN
+        try:
+            self.chessboard.initialize_board_from_fen(fen)
+        except ValueError:
+            self.chessboard.initialize_board_from_fen(START_FEN)  # Never leave a half loaded board behind
+            raise
+        for text in moves:
+            move = move_from_uci(self.chessboard, text)
+            if move is None:
+                self.send(f"info string illegal move {text}")
+                break
+            self.chessboard.make_move(move)
+
+    def go(self, arguments):
+        limits = {}
+        flags = set()
+        index = 0
+        while index < len(arguments):
+            token = arguments[index]
+            if token in ("infinite", "ponder"):
+                flags.add(token)
+                index += 1
+            elif token == "searchmoves":
+                break  # Not supported, search all moves
+            else:
+                if index + 1 < len(arguments):
+                    limits[token] = int(arguments[index + 1])
+                index += 2
+
+        self.waiting = bool(flags)
+        self.finished.clear()
+        self.searcher = Searcher(self.chessboard, self.table, None if flags else self.book, self.tablebases)
+        self.searcher.pondering = "ponder" in flags  # Before the worker starts, so ponderhit cannot be missed
+        self.worker = threading.Thread(target=self.search, daemon=True,
+                                       args=(limits.get("depth", MAX_PLY), self.allot_time(limits),
+                                             limits.get("nodes")))
+        self.worker.start()
+
+    def allot_time(self, limits):
+        # Seconds to spend on this move, None to search until stopped or a depth/node limit is hit
+        if "movetime" in limits:
+            return limits["movetime"] / 1000
+        remaining = limits.get("wtime" if self.chessboard.active_color == 'w' else "btime")
+        if remaining is None:
+            return None
+        increment = limits.get("winc" if self.chessboard.active_color == 'w' else "binc", 0)
+        moves_to_go = limits.get("movestogo", 30)
+        # An equal share of the remaining time plus most of the increment, keeping a safety margin
+        return max(0.01, min(remaining * 0.8, remaining / moves_to_go + increment * 0.8) / 1000 - 0.05)
+
+    def search(self, max_depth, time_limit, node_limit):
+        result = self.searcher.search(max_depth, time_limit, node_limit, info=self.send_info)
+        if self.waiting and not self.searcher.stop:
+            self.finished.wait()  # Finished early, UCI wants bestmove only after stop or ponderhit
+        if result.best_move is None:
+            self.send("bestmove 0000")
+        elif len(result.pv) > 1:
+            self.send(f"bestmove {move_to_uci(result.best_move)} ponder {move_to_uci(result.pv[1])}")
+        else:
+            self.send(f"bestmove {move_to_uci(result.best_move)}")
+
+    def send_info(self, result):
+        elapsed = max(result.elapsed, 1e-6)
+        self.send(f"info depth {result.depth} score {format_score(result.score)} nodes {result.nodes} "
+                  f"nps {int(result.nodes / elapsed)} time {int(result.elapsed * 1000)} hashfull {self.table.hashfull()} "
+                  f"pv {' '.join(move_to_uci(move) for move in result.pv)}")
+
+    def ponderhit(self):
+        # The opponent played the expected move: the search goes on as a normal one with the limits of its go
+        # command, its clock starting now
+        if self.searcher is None or not self.searcher.pondering:
+            return
+        self.searcher.pondering = False
+        self.waiting = False
+        self.finished.set()
+
+    def stop(self):
+        # Keep raising the flag until the worker is gone, the search clears it when it starts
+        while self.worker is not None and self.worker.is_alive():
+            self.searcher.stop = True
+            self.finished.set()
+            self.worker.join(0.01)
+        self.worker = None
+
+
+def main():
+    UciEngine().run()
+
+
+if __name__ == "__main__":
+    main()